@@ -0,0 +1,120 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from assets_lookup import texture_lookup, background_lookup, model_lookup
+from process_image import read_image
+
+texture_channels = ["texture", "roughness", "normal", "metallic", "displace"]
+model_channels = texture_channels + ["orm"]
+
+def asset_nbytes(value):
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if not hasattr(value, "__dict__"):
+        return 0            # None or a constant channel
+    # MeshData and similar containers of arrays
+    return sum(int(v.nbytes) for v in vars(value).values() if hasattr(v, "nbytes"))
+
+def load_channel(source, channel, resolution=None):
+    path = getattr(source.at_resolution(resolution), channel)
+    if not isinstance(path, str):
+        return path         # None or a constant
+    return read_image(path)
+
+class AssetCache:
+    # Decoded textures, backgrounds and meshes of the lookup tables, loaded on first access and
+    # kept in an LRU bounded by max_bytes. Concurrent requests for the same missing key share a
+    # single load; an entry larger than the whole budget is returned without being cached.
+    def __init__(self, max_bytes=2 << 30):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()        # key -> (value, nbytes)
+        self.pending = dict()               # key -> Future of an in-flight load
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, loader):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            future = self.pending.get(key)
+            if future is not None:
+                self.hits += 1
+                owner = False
+            else:
+                future = Future()
+                self.pending[key] = future
+                self.misses += 1
+                owner = True
+        if not owner:
+            return future.result()
+
+        try:
+            value = loader()
+        except BaseException as e:
+            with self.lock:
+                del self.pending[key]
+            future.set_exception(e)
+            raise
+        nbytes = asset_nbytes(value)
+        with self.lock:
+            del self.pending[key]
+            if nbytes <= self.max_bytes:
+                self.entries[key] = (value, nbytes)
+                self.current_bytes += nbytes
+                self.evict()
+        future.set_result(value)
+        return value
+
+    def evict(self):
+        while self.current_bytes > self.max_bytes and len(self.entries) > 0:
+            _, (_, nbytes) = self.entries.popitem(last=False)
+            self.current_bytes -= nbytes
+            self.evictions += 1
+
+    # Image entries are keyed by (name, channel, resolution): a hit does not look at the lookup
+    # tables or the pyramid folders, the path is only resolved on a miss. A channel that is None
+    # or a constant is cached as it is.
+    def texture(self, name, channel="texture", resolution=None):
+        if channel not in texture_channels:
+            raise Exception(f"Invalid texture channel: {channel}")
+        return self.get(
+            ("texture", name, channel, resolution), lambda: load_channel(texture_lookup[name], channel, resolution)
+        )
+
+    def background(self, name, resolution=None):
+        return self.get(
+            ("background", name, resolution), lambda: load_channel(background_lookup[name], "texture", resolution)
+        )
+
+    def model_texture(self, name, channel="texture", resolution=None):
+        if channel not in model_channels:
+            raise Exception(f"Invalid texture channel: {channel}")
+        return self.get(
+            ("model", name, channel, resolution), lambda: load_channel(model_lookup[name], channel, resolution)
+        )
+
+    def mesh(self, name):
+        source = model_lookup[name]
+        return self.get(("mesh", source.object), source.load_mesh)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
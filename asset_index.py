@@ -0,0 +1,330 @@
+import os
+import re
+import json
+import argparse
+
+# the same folders as assets_lookup.py, whose hand-written table is only imported on a lookup
+asset_folder = "./assets"
+texture_folder = os.path.join(asset_folder, "textures")
+model_folder = os.path.join(asset_folder, "models")
+background_folder = os.path.join(asset_folder, "backgrounds")
+index_file = os.path.join(asset_folder, ".asset_index.json")
+index_version = 3
+
+image_extensions = (".png", ".jpg", ".jpeg", ".exr", ".hdr", ".tif", ".tiff")
+
+# <prefix>_<channel>_<resolution>.<ext>, as in dark_wood_nor_gl_4k.exr or fabric_pattern_05_col_01_4k.png
+set_pattern = re.compile(
+    r"^(?P<prefix>.+?)_(?P<channel>diff|col(?:_\d+)?|rough|nor_gl|nor_dx|disp|metal)_(?P<resolution>\d+k)$"
+)
+set_channels = {
+    "diff": "texture",
+    "col": "texture",
+    "rough": "roughness",
+    "nor_gl": "normal",
+    "disp": "displace",
+    "metal": "metallic",
+}
+# <channel>_<material index>.png, as exported by process_glb.py ("matallic" is the exported spelling)
+glb_pattern = re.compile(r"^(?P<channel>color|roughness|matallic|orm)_(?P<index>\d+)$")
+glb_channels = {"color": "texture", "roughness": "roughness", "matallic": "metallic", "orm": "orm"}
+resolution_pattern = re.compile(r"_(\d+k)$")
+
+def directory_signature(root):
+    # mtimes of every directory below root; adding, removing or renaming a file changes one of them
+    signature = dict()
+    for dir_path, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        signature[os.path.relpath(dir_path, root).replace(os.sep, "/")] = os.stat(dir_path).st_mtime_ns
+    return signature
+
+def list_files(root):
+    files = list()
+    for dir_path, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in sorted(filenames):
+            if not filename.startswith("."):
+                files.append(os.path.relpath(os.path.join(dir_path, filename), root).replace(os.sep, "/"))
+    return files
+
+def classify_texture(stem):
+    match = set_pattern.match(stem)
+    if match is not None:
+        channel = match.group("channel")
+        channel = "col" if channel.startswith("col") else channel
+        if channel in set_channels:
+            return match.group("prefix"), set_channels[channel], match.group("resolution")
+    return None
+
+def scan_texture_unit(unit, files):
+    # unit is a directory under ./assets/textures, files are relative to it
+    entries = dict()
+    loose = list()
+    for file in files:
+        stem, extension = os.path.splitext(os.path.basename(file))
+        if extension.lower() not in image_extensions:
+            continue
+        classified = classify_texture(stem)
+        path = f"{unit}/{file}"
+        if classified is None:
+            loose.append((stem, path))
+            continue
+        prefix, channel, resolution = classified
+        entry = entries.setdefault(prefix, {"paths": dict(), "prefix": prefix, "tags": ["texture", unit]})
+        entry["paths"].setdefault(channel, path)
+        if resolution not in entry["tags"]:
+            entry["tags"].append(resolution)
+    for entry in entries.values():
+        entry["tags"].extend(c for c in ("roughness", "normal", "displace", "metallic") if c in entry["paths"])
+        entry["aliases"] = [unit] if len(entries) == 1 and unit != entry["prefix"] else []
+
+    # images without a channel suffix stand on their own, e.g. baked textures and logos
+    for stem, path in loose:
+        name = stem.replace("-", "_")
+        if name in entries:
+            continue
+        entries[name] = {
+            "paths": {"texture": path},
+            "prefix": unit,
+            "tags": ["texture"] + path.split("/")[:-1],
+            "aliases": [os.path.basename(os.path.dirname(path))] if len(loose) == 1 else [],
+        }
+    return {"textures": entries}
+
+def read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r") as file:
+        return json.load(file)
+
+def scan_model_unit(unit, files):
+    # unit is <kind>/<name> under ./assets/models, with models/ and textures/ folders
+    kind, name = unit.split("/", 1)
+    objects = [f for f in files if f.startswith("models/") and f.endswith(".obj")]
+    texture_files = [f for f in files if f.startswith("textures/")]
+    if len(objects) == 0:
+        return {"models": dict()}
+
+    materials = dict()          # material index -> {channel: path or constant}
+    sets = dict()               # texture set prefix -> {channel: path}
+    for file in texture_files:
+        stem, extension = os.path.splitext(os.path.basename(file))
+        if extension.lower() not in image_extensions:
+            continue
+        match = glb_pattern.match(stem)
+        if match is not None:
+            channels = materials.setdefault(int(match.group("index")), dict())
+            channels[glb_channels[match.group("channel")]] = f"{unit}/{file}"
+            continue
+        classified = classify_texture(stem)
+        if classified is not None:
+            sets.setdefault(classified[0], dict()).setdefault(classified[1], f"{unit}/{file}")
+    # constants of materials without textures, see GLBObjectScene.export_materials
+    for index, description in enumerate(read_json(os.path.join(model_folder, unit, "textures", "materials.json"), [])):
+        channels = materials.setdefault(index, dict())
+        for key, channel in (("color", "texture"), ("metallic", "metallic"), ("roughness", "roughness")):
+            if key in description and not isinstance(description[key], str):
+                channels.setdefault(channel, description[key])
+        if "orm_channels" in description:
+            channels["channels"] = description["orm_channels"]
+    # objects.json for per-object exports, instances.json for --instances exports
+    object_materials = dict()
+    for listing in ("objects.json", "instances.json"):
+        for o in read_json(os.path.join(model_folder, unit, "models", listing), []):
+            object_materials[o["mesh"]] = o["material"]
+
+    entries = dict()
+    for file in objects:
+        stem = os.path.splitext(os.path.basename(file))[0]
+        if f"{stem}.obj" in object_materials:
+            channels = materials.get(object_materials[f"{stem}.obj"], dict())
+        elif len(materials) > 0:
+            # GLB exports without objects.json: object indices are node instances, not materials
+            channels = dict()
+        elif len(sets) > 0:
+            matching = [prefix for prefix in sets if stem.startswith(prefix)]
+            channels = sets[matching[0]] if len(matching) > 0 else sets[sorted(sets)[0]]
+        else:
+            channels = dict()
+        entry_name = name if len(objects) == 1 else f"{name}/{stem}"
+        entries[entry_name] = {
+            "paths": dict(channels, object=f"{unit}/{file}"),
+            "prefix": name,
+            "tags": ["model", kind] + (["textured"] if isinstance(channels.get("texture"), str) else []),
+            "aliases": [],
+        }
+    return {"models": entries}
+
+def scan_background_unit(files):
+    entries = dict()
+    for file in files:
+        stem, extension = os.path.splitext(os.path.basename(file))
+        if extension.lower() not in image_extensions:
+            continue
+        name = resolution_pattern.sub("", stem)
+        tags = ["background", extension.lower()[1:]]
+        if extension.lower() in (".exr", ".hdr"):
+            tags.append("hdr")
+        match = resolution_pattern.search(stem)
+        if match is not None:
+            tags.append(match.group(1))
+        entries.setdefault(name, {"paths": {"texture": file}, "prefix": name, "tags": tags, "aliases": []})
+    return {"backgrounds": entries}
+
+class AssetIndex:
+    # Textures, models and backgrounds discovered under ./assets, persisted as JSON. The scan is
+    # split into units (one texture set folder, one model folder, the backgrounds folder); a rescan
+    # only re-lists the units whose directory mtimes changed. Lookups are dictionary accesses,
+    # the index file is only read on the first one.
+    def __init__(self, path=index_file):
+        self.path = path
+        self.units = None
+        self.names = None
+
+    def unit_roots(self):
+        roots = dict()
+        if os.path.isdir(texture_folder):
+            for entry in sorted(os.scandir(texture_folder), key=lambda e: e.name):
+                if entry.is_dir() and not entry.name.startswith("."):
+                    roots[f"textures/{entry.name}"] = entry.path
+        if os.path.isdir(model_folder):
+            for kind in sorted(os.scandir(model_folder), key=lambda e: e.name):
+                if not kind.is_dir() or kind.name.startswith("."):
+                    continue
+                for entry in sorted(os.scandir(kind.path), key=lambda e: e.name):
+                    if entry.is_dir() and not entry.name.startswith("."):
+                        roots[f"models/{kind.name}/{entry.name}"] = entry.path
+        if os.path.isdir(background_folder):
+            roots["backgrounds"] = background_folder
+        return roots
+
+    def scan(self, full=False):
+        previous = dict() if full else self.read_units()
+        units = dict()
+        rescanned = 0
+        for key, root in self.unit_roots().items():
+            signature = directory_signature(root)
+            if key in previous and previous[key]["signature"] == signature:
+                units[key] = previous[key]
+                continue
+            files = list_files(root)
+            if key.startswith("textures/"):
+                entries = scan_texture_unit(key[len("textures/"):], files)
+            elif key.startswith("models/"):
+                entries = scan_model_unit(key[len("models/"):], files)
+            else:
+                entries = scan_background_unit(files)
+            units[key] = dict(entries, signature=signature)
+            rescanned += 1
+        self.units = units
+        self.names = None
+        self.save()
+        return rescanned
+
+    def read_units(self):
+        if not os.path.exists(self.path):
+            return dict()
+        with open(self.path, "r") as file:
+            data = json.load(file)
+        if data.get("version") != index_version:
+            return dict()
+        return data["units"]
+
+    def save(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump({"version": index_version, "units": self.units}, file, separators=(",", ":"))
+        os.replace(temp_path, self.path)
+
+    def load(self):
+        if self.names is not None:
+            return
+        if self.units is None:
+            self.units = self.read_units()
+            if len(self.units) == 0:
+                self.scan()
+        self.names = {"textures": dict(), "models": dict(), "backgrounds": dict()}
+        self.prefixes = dict()
+        self.tags = dict()
+        for unit in self.units.values():
+            for category in self.names:
+                for name, entry in unit.get(category, dict()).items():
+                    for alias in [name] + entry["aliases"]:
+                        self.names[category].setdefault(alias.lower(), (name, entry))
+                    self.prefixes.setdefault(entry["prefix"].lower(), list()).append((category, name, entry))
+                    for tag in entry["tags"]:
+                        self.tags.setdefault(tag.lower(), list()).append((category, name, entry))
+
+    def find(self, category, name):
+        self.load()
+        found = self.names[category].get(name.lower())
+        return None if found is None else make_source(category, found[1])
+
+    def texture(self, name):
+        # hand-written entries of assets_lookup take precedence
+        from assets_lookup import texture_lookup
+
+        return texture_lookup[name] if name in texture_lookup else self.find("textures", name)
+
+    def model(self, name):
+        from assets_lookup import model_lookup
+
+        return model_lookup[name] if name in model_lookup else self.find("models", name)
+
+    def background(self, name):
+        from assets_lookup import background_lookup
+
+        return background_lookup[name] if name in background_lookup else self.find("backgrounds", name)
+
+    def with_prefix(self, prefix):
+        self.load()
+        return {name: make_source(category, entry) for category, name, entry in self.prefixes.get(prefix.lower(), [])}
+
+    def with_tag(self, tag):
+        self.load()
+        return {name: make_source(category, entry) for category, name, entry in self.tags.get(tag.lower(), [])}
+
+def make_source(category, entry):
+    from assets_lookup import TextureSource, ModelSource, BackgroundSource
+
+    paths = entry["paths"]
+    if category == "textures":
+        return TextureSource(
+            texture=paths["texture"] if "texture" in paths else next(iter(paths.values())),
+            roughness=paths.get("roughness"),
+            normal=paths.get("normal"),
+            metallic=paths.get("metallic"),
+            displace=paths.get("displace"),
+        )
+    if category == "models":
+        return ModelSource(
+            object=paths["object"],
+            texture=paths.get("texture"),
+            roughness=paths.get("roughness"),
+            normal=paths.get("normal"),
+            metallic=paths.get("metallic"),
+            displace=paths.get("displace"),
+            orm=paths.get("orm"),
+            channels=paths.get("channels"),
+        )
+    return BackgroundSource(paths["texture"])
+
+default_index = None
+
+def get_index():
+    global default_index
+    if default_index is None:
+        default_index = AssetIndex()
+    return default_index
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--full", action="store_true", default=False)
+    args = parser.parse_args()
+
+    index = get_index()
+    rescanned = index.scan(full=args.full)
+    index.load()
+    print(f"Rescanned {rescanned}/{len(index.units)} asset folders into {index.path}: "
+          f"{len(index.names['textures'])} texture, {len(index.names['models'])} model and "
+          f"{len(index.names['backgrounds'])} background names")
@@ -0,0 +1,83 @@
+import os
+import json
+import hashlib
+
+manifest_folder = "./assets"
+
+def file_hash(filename, chunk_size=1 << 20):
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(filename, "rb") as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+class AssetManifest:
+    # Records, per source file, the (size, mtime, content hash) it had when a tool last
+    # processed it, the outputs it produced and the tool version. A rerun only has to stat
+    # a source to know it can be skipped; the hash is only read when the stat changed.
+    def __init__(self, tool, version, path=None):
+        self.tool = tool
+        self.version = str(version)
+        self.path = os.path.join(manifest_folder, f".{tool}_manifest.json") if path is None else path
+        self.root = os.path.dirname(os.path.abspath(self.path))
+        self.entries = dict()
+        self.dirty = False
+        if os.path.exists(self.path):
+            with open(self.path, "r") as file:
+                data = json.load(file)
+            if data.get("tool") == tool:
+                self.entries = data.get("entries", dict())
+
+    def key(self, filename):
+        return os.path.relpath(os.path.abspath(filename), self.root).replace(os.sep, "/")
+
+    def resolve(self, key):
+        return os.path.join(self.root, key)
+
+    def is_current(self, filename):
+        entry = self.entries.get(self.key(filename))
+        if entry is None or entry["version"] != self.version:
+            return False
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            return False
+        if stat.st_size != entry["size"]:
+            return False
+        if any(not os.path.exists(self.resolve(output)) for output in entry["outputs"]):
+            return False
+        if stat.st_mtime_ns != entry["mtime"]:
+            # touched but possibly unchanged, e.g. after a fresh checkout
+            if file_hash(filename) != entry["hash"]:
+                return False
+            entry["mtime"] = stat.st_mtime_ns
+            self.dirty = True
+        return True
+
+    def record(self, filename, outputs=()):
+        stat = os.stat(filename)
+        self.entries[self.key(filename)] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "hash": file_hash(filename),
+            "outputs": [self.key(output) for output in outputs],
+            "version": self.version,
+        }
+        self.dirty = True
+
+    def forget(self, filename):
+        if self.entries.pop(self.key(filename), None) is not None:
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump({"tool": self.tool, "entries": self.entries}, file, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+        self.dirty = False
@@ -1,9 +1,21 @@
 import os
+import copy
 
 texture_folder = "./assets/textures"
 model_folder = "./assets/models"
 background_folder = "./assets/backgrounds"
 
+def at_resolution(source, channels, resolution):
+    # a copy of source whose image channels point at the closest level built by texture_pyramid.py
+    from texture_pyramid import closest_level
+
+    selected = copy.copy(source)
+    for channel in channels:
+        path = getattr(source, channel)
+        if isinstance(path, str):
+            setattr(selected, channel, closest_level(path, resolution))
+    return selected
+
 class TextureSource:
     def __init__(
         self,
@@ -19,6 +31,9 @@ class TextureSource:
         self.metallic = None if metallic is None else os.path.join(texture_folder, metallic)
         self.displace = None if displace is None else os.path.join(texture_folder, displace)
 
+    def at_resolution(self, resolution=None):
+        return at_resolution(self, ["texture", "roughness", "normal", "metallic", "displace"], resolution)
+
 class BackgroundSource:
     def __init__(
         self,
@@ -26,6 +41,15 @@ class BackgroundSource:
     ):
         self.texture = os.path.join(background_folder, texture)
 
+    def at_resolution(self, resolution=None):
+        return at_resolution(self, ["texture"], resolution)
+
+def model_channel(value):
+    # texture, roughness and metallic may also be constants, see materials.json of GLB exports
+    if value is None or not isinstance(value, str):
+        return value
+    return os.path.join(model_folder, value)
+
 class ModelSource:
     def __init__(
         self,
@@ -34,14 +58,38 @@ class ModelSource:
         roughness = None,
         normal = None,
         metallic = None,
-        displace = None
+        displace = None,
+        orm = None,
+        channels = None
     ):
         self.object = os.path.join(model_folder, object)
-        self.texture = os.path.join(model_folder, texture)
-        self.roughness = None if roughness is None else os.path.join(model_folder, roughness)
+        self.texture = model_channel(texture)
+        self.roughness = model_channel(roughness)
         self.normal = None if normal is None else os.path.join(model_folder, normal)
-        self.metallic = None if metallic is None else os.path.join(model_folder, metallic)
+        self.metallic = model_channel(metallic)
         self.displace = None if displace is None else os.path.join(model_folder, displace)
+        # a single file holding occlusion, roughness and metallic, and which channel holds which
+        self.orm = model_channel(orm)
+        if orm is not None and channels is None:
+            # process_glb pulls in trimesh and pygltflib, only needed for packed textures
+            from process_glb import orm_layout
+            channels = orm_layout
+        self.channels = None if orm is None else dict(channels)
+
+    def channel(self, name):
+        # (file or constant, channel letter or None) of "occlusion", "roughness" or "metallic"
+        if self.orm is not None and self.channels.get(name) is not None:
+            return self.orm, self.channels[name]
+        return getattr(self, name, None), None
+
+    def at_resolution(self, resolution=None):
+        return at_resolution(self, ["texture", "roughness", "normal", "metallic", "displace", "orm"], resolution)
+
+    def load_mesh(self):
+        # memory-maps the binary sidecar of the OBJ when it is up to date
+        from mesh_cache import load_mesh
+
+        return load_mesh(self.object)
 
 
 texture_lookup = {
@@ -0,0 +1,186 @@
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from process_obj import has_zup_tag
+
+# Reports what the converters would change without running them. Only headers are read: the
+# attribute block of an EXR, the leading comments of an OBJ and the JSON chunk of a GLB.
+
+exr_magic = 20000630
+exr_tiled_flag = 0x200
+# values of the "compression" attribute, in the order of Imath.Compression
+exr_compressions = ["NO", "RLE", "ZIPS", "ZIP", "PIZ", "PXR24", "B44", "B44A", "DWAA", "DWAB"]
+exr_target_compression = "PIZ"      # what process_exr.py converts to
+
+glb_magic = b"glTF"
+glb_json_chunk = 0x4E4F534A
+
+def read_exr_header(filename, chunk_size=1 << 14):
+    # attributes are name\0 type\0 int32 size, value; the list ends with an empty name
+    with open(filename, "rb") as file:
+        data = file.read(chunk_size)
+
+        def ensure(size):
+            nonlocal data
+            while len(data) < size:
+                more = file.read(chunk_size)
+                if len(more) == 0:
+                    raise Exception("Truncated EXR header")
+                data += more
+
+        def read_string(offset):
+            end = data.find(b"\0", offset)
+            while end < 0:
+                ensure(len(data) + 1)
+                end = data.find(b"\0", offset)
+            return data[offset: end].decode("latin-1"), end + 1
+
+        ensure(8)
+        magic, version = struct.unpack_from("<II", data, 0)
+        if magic != exr_magic:
+            raise Exception("Not an OpenEXR file")
+        attributes = dict()
+        offset = 8
+        while True:
+            name, offset = read_string(offset)
+            if name == "":
+                break
+            attribute_type, offset = read_string(offset)
+            ensure(offset + 4)
+            size, = struct.unpack_from("<i", data, offset)
+            ensure(offset + 4 + size)
+            attributes[name] = (attribute_type, data[offset + 4: offset + 4 + size])
+            offset += 4 + size
+    return version, attributes
+
+def channel_names(chlist):
+    # name\0 followed by 16 bytes of pixel type, linear flag and sampling, ends with \0
+    names = list()
+    offset = 0
+    while offset < len(chlist) and chlist[offset] != 0:
+        end = chlist.index(b"\0", offset)
+        names.append(chlist[offset: end].decode("latin-1"))
+        offset = end + 1 + 16
+    return names
+
+def audit_exr(filename):
+    # multi-part files are audited by their first header
+    version, attributes = read_exr_header(filename)
+    compression = exr_compressions[attributes["compression"][1][0]]
+    x0, y0, x1, y1 = struct.unpack("<4i", attributes["dataWindow"][1])
+    details = {
+        "compression": compression,
+        "width": x1 - x0 + 1,
+        "height": y1 - y0 + 1,
+        "channels": channel_names(attributes["channels"][1]),
+        "tiled": bool(version & exr_tiled_flag),
+    }
+    reasons = list()
+    if compression != exr_target_compression:
+        reasons.append(f"compression {compression}, expected {exr_target_compression}")
+    return reasons, details
+
+def audit_obj(filename):
+    if has_zup_tag(filename):
+        return [], {"zup": True}
+    return ["missing # ZUP tag"], {"zup": False}
+
+def read_glb_json(filename):
+    with open(filename, "rb") as file:
+        header = file.read(20)
+        if len(header) < 20:
+            raise Exception("Truncated GLB header")
+        magic, version, length, chunk_length, chunk_type = struct.unpack("<4sIIII", header)
+        if magic != glb_magic or chunk_type != glb_json_chunk:
+            raise Exception("Not a binary glTF file")
+        return version, json.loads(file.read(chunk_length))
+
+def audit_glb(filename):
+    version, gltf = read_glb_json(filename)
+    meshes = gltf.get("meshes", [])
+    details = {
+        "version": version,
+        "nodes": len(gltf.get("nodes", [])),
+        "meshes": len(meshes),
+        "primitives": sum(len(mesh.get("primitives", [])) for mesh in meshes),
+        "materials": len(gltf.get("materials", [])),
+        "images": len(gltf.get("images", [])),
+    }
+    reasons = list()
+    # process_glb.py exports next to the GLB into a folder named after it
+    export_dir = os.path.splitext(filename)[0]
+    if not os.path.isdir(os.path.join(export_dir, "models")):
+        reasons.append("not extracted")
+    return reasons, details
+
+auditors = {".exr": ("exr", audit_exr), ".obj": ("obj", audit_obj), ".glb": ("glb", audit_glb)}
+
+def find_audit_files(roots):
+    file_paths = list()
+    for root in roots:
+        for dir_path, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            for filename in sorted(filenames):
+                if os.path.splitext(filename)[1].lower() in auditors:
+                    file_paths.append(os.path.join(dir_path, filename))
+    return file_paths
+
+def audit_file(filename):
+    kind, auditor = auditors[os.path.splitext(filename)[1].lower()]
+    result = {"path": filename, "kind": kind, "size": os.path.getsize(filename)}
+    try:
+        reasons, details = auditor(filename)
+    except Exception as e:
+        reasons, details = [f"unreadable: {e!r}"], dict()
+    result["reasons"] = reasons
+    result.update(details)
+    return result
+
+def audit(roots, jobs=16):
+    start = time.perf_counter()
+    file_paths = find_audit_files(roots)
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        results = list(executor.map(audit_file, file_paths))
+    elapsed = time.perf_counter() - start
+
+    summary = dict()
+    for result in results:
+        entry = summary.setdefault(result["kind"], {
+            "files": 0, "bytes": 0, "non_compliant": 0, "non_compliant_bytes": 0
+        })
+        entry["files"] += 1
+        entry["bytes"] += result["size"]
+        if len(result["reasons"]) > 0:
+            entry["non_compliant"] += 1
+            entry["non_compliant_bytes"] += result["size"]
+    return {
+        "roots": roots,
+        "elapsed": elapsed,
+        "summary": summary,
+        "non_compliant": [result for result in results if len(result["reasons"]) > 0],
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", type=str, nargs="+", default=["./assets/"])
+    parser.add_argument("--jobs", type=int, default=16)
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+
+    report = audit(args.path, jobs=args.jobs)
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+    else:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=1)
+    files = sum(entry["files"] for entry in report["summary"].values())
+    print(f"Audited {files} files in {report['elapsed']:.3f}s: {len(report['non_compliant'])} non-compliant",
+          file=sys.stderr)
+    if len(report["non_compliant"]) > 0:
+        raise SystemExit(1)
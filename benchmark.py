@@ -0,0 +1,410 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+from io import BytesIO
+from PIL import Image
+
+# Times the conversion hot paths on synthetic inputs. The inputs are generated from a fixed seed
+# (same parameters, same files) into a work folder and reused by later runs. Every stage runs in
+# its own python process, so its peak RSS is its own; the results are JSON, and a run can be
+# checked against an earlier one for throughput regressions.
+
+benchmark_version = 2
+default_work_dir = os.path.join(tempfile.gettempdir(), "asset_loader_benchmark")
+result_marker = "BENCHMARK_RESULT "
+
+def synthetic_mesh(vertex_count, seed=0):
+    # a displaced square grid of about vertex_count vertices, y-up, with normals and UVs
+    rng = np.random.default_rng(seed)
+    side = max(2, int(round(np.sqrt(vertex_count))))
+    u, v = np.meshgrid(np.linspace(0.0, 1.0, side, dtype=np.float32), np.linspace(0.0, 1.0, side, dtype=np.float32))
+    height = np.float32(0.02) * rng.standard_normal((side, side), dtype=np.float32)
+    vertices = np.stack([u, height, v], axis=-1).reshape(-1, 3)
+    dv, du = np.gradient(height, 1.0 / (side - 1))
+    normals = np.stack([-du, np.ones_like(height), -dv], axis=-1).reshape(-1, 3)
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+    uvs = np.stack([u, v], axis=-1).reshape(-1, 2)
+    index = np.arange(side * side, dtype=np.uint32).reshape(side, side)
+    a, b, c, d = index[:-1, :-1], index[:-1, 1:], index[1:, :-1], index[1:, 1:]
+    faces = np.concatenate([np.stack([a, d, b], axis=-1), np.stack([a, c, d], axis=-1)]).reshape(-1, 3)
+    return vertices, faces, normals.astype(np.float32), uvs
+
+def synthetic_texture(size, channels, seed=0):
+    # smooth color blobs with a little noise, compresses about like a photographed texture
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (8, 8, channels), dtype=np.uint8)
+    mode = {1: "L", 3: "RGB", 4: "RGBA"}[channels]
+    pixels = np.array(Image.fromarray(coarse.squeeze(), mode).resize((size, size), Image.BICUBIC))
+    pixels = pixels.reshape(size, size, channels)
+    np.minimum(pixels, 239, out=pixels)
+    pixels += rng.integers(0, 16, pixels.shape, dtype=np.uint8)
+    if channels == 4:
+        pixels[:, :, 3] = 255
+    return pixels.squeeze()
+
+def png_bytes(pixels):
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+def make_glb(glb_file, vertices=100000, nodes=64, instances=4, texture_size=2048, materials=2, seed=0):
+    # nodes in a ternary tree with random TRS, every unique mesh instanced by `instances` nodes,
+    # every material with an embedded base color and metallicRoughness texture
+    import pygltflib
+
+    rng = np.random.default_rng(seed)
+    blob = bytearray()
+    buffer_views = list()
+    accessors = list()
+
+    def add_view(data, target=None):
+        while len(blob) % 4 != 0:
+            blob.append(0)
+        buffer_views.append(pygltflib.BufferView(buffer=0, byteOffset=len(blob), byteLength=len(data), target=target))
+        blob.extend(data)
+        return len(buffer_views) - 1
+
+    def add_accessor(array, accessor_type, component_type, target, bounds=False):
+        view = add_view(np.ascontiguousarray(array).tobytes(), target)
+        accessors.append(pygltflib.Accessor(
+            bufferView=view, componentType=component_type, count=len(array), type=accessor_type,
+            min=array.min(axis=0).tolist() if bounds else None, max=array.max(axis=0).tolist() if bounds else None,
+        ))
+        return len(accessors) - 1
+
+    images, textures, material_list = list(), list(), list()
+    for m in range(materials):
+        for channels in (4, 3):
+            view = add_view(png_bytes(synthetic_texture(texture_size, channels, seed + 100 * m + channels)))
+            images.append(pygltflib.Image(bufferView=view, mimeType="image/png"))
+            textures.append(pygltflib.Texture(source=len(images) - 1))
+        material_list.append(pygltflib.Material(pbrMetallicRoughness=pygltflib.PbrMetallicRoughness(
+            baseColorTexture=pygltflib.TextureInfo(index=len(textures) - 2),
+            metallicRoughnessTexture=pygltflib.TextureInfo(index=len(textures) - 1),
+            metallicFactor=0.5, roughnessFactor=0.8,
+        )))
+
+    meshes = list()
+    for k in range(max(1, nodes // max(instances, 1))):
+        points, faces, normals, uvs = synthetic_mesh(vertices, seed + k)
+        attributes = pygltflib.Attributes(
+            POSITION=add_accessor(points, "VEC3", pygltflib.FLOAT, pygltflib.ARRAY_BUFFER, bounds=True),
+            NORMAL=add_accessor(normals, "VEC3", pygltflib.FLOAT, pygltflib.ARRAY_BUFFER),
+            TEXCOORD_0=add_accessor(uvs, "VEC2", pygltflib.FLOAT, pygltflib.ARRAY_BUFFER),
+        )
+        indices = add_accessor(
+            faces.reshape(-1), "SCALAR", pygltflib.UNSIGNED_INT, pygltflib.ELEMENT_ARRAY_BUFFER
+        )
+        meshes.append(pygltflib.Mesh(primitives=[
+            pygltflib.Primitive(attributes=attributes, indices=indices, material=k % max(materials, 1))
+        ]))
+    if materials == 0:
+        for mesh in meshes:
+            mesh.primitives[0].material = None
+
+    node_list = list()
+    for i in range(nodes):
+        rotation = rng.standard_normal(4)
+        node_list.append(pygltflib.Node(
+            mesh=i % len(meshes),
+            translation=rng.uniform(-1.0, 1.0, 3).tolist(),
+            rotation=(rotation / np.linalg.norm(rotation)).tolist(),
+            scale=rng.uniform(0.5, 1.5, 3).tolist(),
+            children=[c for c in range(3 * i + 1, 3 * i + 4) if c < nodes],
+        ))
+
+    glb = pygltflib.GLTF2(
+        scene=0, scenes=[pygltflib.Scene(nodes=[0])], nodes=node_list, meshes=meshes,
+        accessors=accessors, bufferViews=buffer_views, buffers=[pygltflib.Buffer(byteLength=len(blob))],
+        images=images, textures=textures, materials=material_list,
+    )
+    glb.set_binary_blob(bytes(blob))
+    glb.save(glb_file)
+    return glb_file
+
+def make_obj(obj_file, vertices=1000000, seed=0):
+    from process_obj import write_obj
+
+    points, faces, normals, uvs = synthetic_mesh(vertices, seed)
+    write_obj(obj_file, points, faces, vertex_normals=normals, uvs=uvs)
+    return obj_file
+
+def make_exr(exr_file, size=2048, channels=8, seed=0):
+    # ZIP compressed, HDR values up to ~8; RGBA as HALF and the remaining AOV channels as FLOAT
+    import Imath
+    from process_image import write_exr
+
+    rng = np.random.default_rng(seed)
+    names = ["R", "G", "B", "A"][:channels] + [f"AOV{i}" for i in range(channels - 4)]
+    ramp = np.linspace(0.0, 1.0, size, dtype=np.float32)
+    image = np.empty((size, size, channels), dtype=np.float32)
+    for i in range(channels):
+        phase = rng.uniform(0.0, 2.0 * np.pi, 2)
+        image[:, :, i] = 4.0 + 4.0 * np.sin(6.0 * ramp[:, None] + phase[0]) * np.cos(4.0 * ramp[None, :] + phase[1])
+        image[:, :, i] += rng.uniform(0.0, 0.05, (size, size)).astype(np.float32)
+    pixel_types = {name: "HALF" for name in names[:4]}
+    write_exr(exr_file, image, names, pixel_types, Imath.Compression.ZIP_COMPRESSION)
+    return exr_file
+
+def input_files(work_dir, config):
+    # file names carry every parameter, so a changed configuration never reuses stale inputs
+    return {
+        "glb": os.path.join(work_dir, "scene_v{glb_vertices}_n{glb_nodes}_i{glb_instances}_t{texture_size}"
+                                      "_m{materials}_s{seed}.glb".format(**config)),
+        "obj": os.path.join(work_dir, "mesh_v{obj_vertices}_s{seed}.obj".format(**config)),
+        "exr": os.path.join(work_dir, "image_{exr_size}_c{exr_channels}_s{seed}.exr".format(**config)),
+    }
+
+def prepare_inputs(work_dir, config, kinds):
+    os.makedirs(work_dir, exist_ok=True)
+    files = input_files(work_dir, config)
+    makers = {
+        "glb": lambda path: make_glb(
+            path, config["glb_vertices"], config["glb_nodes"], config["glb_instances"],
+            config["texture_size"], config["materials"], config["seed"]
+        ),
+        "obj": lambda path: make_obj(path, config["obj_vertices"], config["seed"]),
+        "exr": lambda path: make_exr(path, config["exr_size"], config["exr_channels"], config["seed"]),
+    }
+    for kind in kinds:
+        if not os.path.exists(files[kind]):
+            start = time.perf_counter()
+            temp_file = f"{os.path.splitext(files[kind])[0]}.tmp{os.path.splitext(files[kind])[1]}"
+            makers[kind](temp_file)
+            os.replace(temp_file, files[kind])
+            print(f"Generated {files[kind]} ({os.path.getsize(files[kind]) / 1e6:.1f} MB) "
+                  f"in {time.perf_counter() - start:.2f}s")
+    return files
+
+# Stages: prepare(inputs, scratch_dir) does the untimed setup of one run and returns the timed
+# function, which returns the bytes it processed (the file read, or written for exports).
+def glb_parse_stage(inputs, scratch_dir):
+    from process_glb import GLBObjectScene
+
+    def run():
+        scene = GLBObjectScene(inputs["glb"], "benchmark")
+        scene.objects           # node transforms are applied lazily
+        return os.path.getsize(inputs["glb"])
+    return run
+
+def glb_export_stage(inputs, scratch_dir):
+    from process_glb import convert_glb
+
+    glb_file = os.path.join(scratch_dir, os.path.basename(inputs["glb"]))
+    shutil.copyfile(inputs["glb"], glb_file)
+
+    def run():
+        convert_glb(glb_file)
+        return os.path.getsize(glb_file)
+    return run
+
+def export_without_mtl_stage(inputs, scratch_dir):
+    import trimesh
+    from process_obj import export_without_mtl
+
+    points, faces, normals, uvs = synthetic_mesh(inputs["config"]["obj_vertices"], inputs["config"]["seed"])
+    mesh = trimesh.Trimesh(
+        points, faces, vertex_normals=normals, visual=trimesh.visual.TextureVisuals(uv=uvs), process=False
+    )
+    obj_file = os.path.join(scratch_dir, "export.obj")
+
+    def run():
+        export_without_mtl(mesh, obj_file)
+        return os.path.getsize(obj_file)
+    return run
+
+def fix_zup_stage(inputs, scratch_dir):
+    from process_obj import fix_zup
+    from mesh_cache import ensure_mesh_cache
+
+    obj_file = os.path.join(scratch_dir, os.path.basename(inputs["obj"]))
+    shutil.copyfile(inputs["obj"], obj_file)
+
+    # the sidecar is built untimed (see mesh_cache), fix_zup then times the streaming rewrite and
+    # the in-place sidecar patch
+    ensure_mesh_cache(obj_file)
+
+    def run():
+        fix_zup(obj_file)
+        return os.path.getsize(inputs["obj"])
+    return run
+
+def mesh_cache_stage(inputs, scratch_dir):
+    from mesh_cache import ensure_mesh_cache
+
+    obj_file = os.path.join(scratch_dir, os.path.basename(inputs["obj"]))
+    shutil.copyfile(inputs["obj"], obj_file)
+
+    def run():
+        ensure_mesh_cache(obj_file)
+        return os.path.getsize(inputs["obj"])
+    return run
+
+def change_compression_type_stage(inputs, scratch_dir):
+    import Imath
+    from process_exr import change_compression_type
+
+    exr_file = os.path.join(scratch_dir, os.path.basename(inputs["exr"]))
+    shutil.copyfile(inputs["exr"], exr_file)
+
+    def run():
+        change_compression_type(exr_file, Imath.Compression.PIZ_COMPRESSION)
+        return os.path.getsize(inputs["exr"])
+    return run
+
+def tonemap_stage(operator):
+    def prepare(inputs, scratch_dir):
+        from tonemap import tonemap_image
+
+        def run():
+            tonemap_image(inputs["exr"], operator=operator)
+            return os.path.getsize(inputs["exr"])
+        return run
+    return prepare
+
+# name -> (input kind, prepare)
+stages = {
+    "glb_parse": ("glb", glb_parse_stage),
+    "glb_export": ("glb", glb_export_stage),
+    "export_without_mtl": ("obj", export_without_mtl_stage),
+    "fix_zup": ("obj", fix_zup_stage),
+    "mesh_cache": ("obj", mesh_cache_stage),
+    "change_compression_type": ("exr", change_compression_type_stage),
+    "tonemap_gamma": ("exr", tonemap_stage("gamma")),
+    "tonemap_reinhard": ("exr", tonemap_stage("reinhard")),
+    "tonemap_aces": ("exr", tonemap_stage("aces")),
+}
+
+def peak_rss():
+    import resource
+
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def run_stage(name, inputs, scratch_dir, repeat=3):
+    # runs in the child process, the fastest of `repeat` runs counts
+    rss_before = peak_rss()
+    seconds = list()
+    processed = 0
+    for _ in range(repeat):
+        if os.path.exists(scratch_dir):
+            shutil.rmtree(scratch_dir)
+        os.makedirs(scratch_dir)
+        run = stages[name][1](inputs, scratch_dir)
+        start = time.perf_counter()
+        processed = run()
+        seconds.append(time.perf_counter() - start)
+    shutil.rmtree(scratch_dir)
+    best = min(seconds)
+    return {
+        "seconds": best,
+        "runs": seconds,
+        "bytes": processed,
+        "mb_per_s": processed / best / 1e6 if best > 0 else 0.0,
+        "rss_before_mb": rss_before / 1e6,
+        "peak_rss_mb": peak_rss() / 1e6,
+    }
+
+def run_benchmark(selected, config, work_dir=default_work_dir, repeat=3):
+    work_dir = os.path.abspath(work_dir)
+    files = prepare_inputs(work_dir, config, sorted(set(stages[name][0] for name in selected)))
+    inputs = dict(files, config=config)
+    results = {
+        "benchmark_version": benchmark_version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": config,
+        "repeat": repeat,
+        "stages": dict(),
+        "failures": dict(),
+    }
+    for name in selected:
+        command = [
+            sys.executable, os.path.abspath(__file__), "--run_stage", name,
+            "--inputs", json.dumps(inputs), "--work_dir", work_dir, "--repeat", str(repeat),
+        ]
+        process = subprocess.run(command, capture_output=True, text=True)
+        lines = [line for line in process.stdout.splitlines() if line.startswith(result_marker)]
+        if process.returncode != 0 or len(lines) == 0:
+            error = (process.stderr.strip().splitlines() or [f"exit code {process.returncode}"])[-1]
+            results["failures"][name] = error
+            print(f"{name:<24} FAILED: {error}")
+            continue
+        stage = json.loads(lines[-1][len(result_marker):])
+        results["stages"][name] = stage
+        print(f"{name:<24} {stage['seconds']:8.3f}s {stage['mb_per_s']:9.1f} MB/s "
+              f"{stage['bytes'] / 1e6:9.1f} MB   peak RSS {stage['peak_rss_mb']:8.1f} MB")
+    return results
+
+def check_regressions(results, baseline, threshold=0.1):
+    # stages whose throughput dropped by more than threshold (a fraction) against the baseline
+    if baseline.get("config") != results.get("config"):
+        print("Warning: the baseline was measured with a different configuration")
+    if baseline.get("benchmark_version") != results.get("benchmark_version"):
+        print("Warning: the baseline was measured by a different benchmark version")
+    regressions = list()
+    for name, stage in results["stages"].items():
+        if name not in baseline.get("stages", dict()):
+            continue
+        before = baseline["stages"][name]["mb_per_s"]
+        after = stage["mb_per_s"]
+        change = after / before - 1.0 if before > 0 else 0.0
+        if change < -threshold:
+            regressions.append((name, before, after, change))
+            print(f"    REGRESSION {name}: {after:.1f} MB/s, {before:.1f} MB/s in the baseline ({change:+.0%})")
+    print(f"{len(regressions)} of {len(results['stages'])} stages regressed by more than {threshold:.0%}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stages", type=str, nargs="+", default=list(stages), choices=list(stages))
+    parser.add_argument("--work_dir", type=str, default=default_work_dir)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=str, default=None)
+    parser.add_argument("--baseline", type=str, default=None)
+    parser.add_argument("--threshold", type=float, default=0.1)
+    # synthetic inputs
+    parser.add_argument("--glb_vertices", type=int, default=100000)
+    parser.add_argument("--glb_nodes", type=int, default=64)
+    parser.add_argument("--glb_instances", type=int, default=4)
+    parser.add_argument("--texture_size", type=int, default=2048)
+    parser.add_argument("--materials", type=int, default=2)
+    parser.add_argument("--obj_vertices", type=int, default=1000000)
+    parser.add_argument("--exr_size", type=int, default=2048)
+    parser.add_argument("--exr_channels", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    # used by the parent process to run one stage in a fresh interpreter
+    parser.add_argument("--run_stage", type=str, default=None)
+    parser.add_argument("--inputs", type=str, default=None)
+    args = parser.parse_args()
+
+    if args.run_stage is not None:
+        inputs = json.loads(args.inputs)
+        scratch_dir = os.path.join(args.work_dir, f"scratch_{args.run_stage}_{os.getpid()}")
+        result = run_stage(args.run_stage, inputs, scratch_dir, args.repeat)
+        print(result_marker + json.dumps(result))
+    else:
+        config = {key: getattr(args, key) for key in (
+            "glb_vertices", "glb_nodes", "glb_instances", "texture_size", "materials",
+            "obj_vertices", "exr_size", "exr_channels", "seed",
+        )}
+        results = run_benchmark(args.stages, config, args.work_dir, args.repeat)
+        if args.output is not None:
+            with open(args.output, "w") as file:
+                json.dump(results, file, indent=4)
+        failed = len(results["failures"]) > 0
+        if args.baseline is not None:
+            with open(args.baseline, "r") as file:
+                baseline = json.load(file)
+            failed = len(check_regressions(results, baseline, args.threshold)) > 0 or failed
+        if failed:
+            raise SystemExit(1)
@@ -1,6 +1,9 @@
-import matplotlib.pyplot as plt
 import numpy as np
 import os
+import time
+import argparse
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
 
 cmaps = [('Perceptually Uniform Sequential', [
             'viridis', 'plasma', 'inferno', 'magma', 'cividis']),
@@ -29,9 +32,10 @@ cmaps = [('Perceptually Uniform Sequential', [
 gradient = np.linspace(0, 1, 256)
 gradient = np.vstack((gradient, gradient))
 bar_folder = "./assets/textures/color_bar"
-os.makedirs(bar_folder, exist_ok=True)
 
 def plot_color_gradients(cmap_category, cmap_list):
+    import matplotlib.pyplot as plt
+
     # Create figure and adjust figure height to number of colormaps
     nrows = len(cmap_list)
     figh = 0.35 + 0.15 + (nrows + (nrows-1)*0.1)*0.22
@@ -49,15 +53,53 @@ def plot_color_gradients(cmap_category, cmap_list):
     for ax in axs:
         ax.set_axis_off()
 
-def create_bar_texture(name):
-    fig = plt.figure(figsize=(2.56, 0.01), dpi=100, frameon=False)
-    ax = plt.Axes(fig, [0., 0., 1., 1.])    # Create an Axes object that covers the entire figure
-    ax.set_axis_off()
-    fig.add_axes(ax)
-    ax.imshow(gradient, cmap=name)
-    plt.savefig(os.path.join(bar_folder, f"{name}.png"), bbox_inches='tight', pad_inches=0)
+def create_bar_texture(name, width=256, height=1, exr=False, output_dir=bar_folder):
+    # Samples the colormap's LUT directly, no figure involved: uint8 RGBA PNG, or float RGBA EXR
+    import matplotlib
+
+    cmap = matplotlib.colormaps[name]
+    positions = np.linspace(0.0, 1.0, width)
+    if exr:
+        from process_image import write_exr
+
+        strip = np.asarray(cmap(positions), dtype=np.float32)
+        bar_file = os.path.join(output_dir, f"{name}.exr")
+        write_exr(bar_file, np.broadcast_to(strip, (height, width, 4)), ["R", "G", "B", "A"])
+    else:
+        strip = cmap(positions, bytes=True)
+        bar_file = os.path.join(output_dir, f"{name}.png")
+        Image.fromarray(np.ascontiguousarray(np.broadcast_to(strip, (height, width, 4)))).save(bar_file)
+    return bar_file
+
+def create_bar_textures(names, width=256, height=1, exr=False, output_dir=bar_folder, jobs=1):
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    count = len(names)
+    if jobs <= 1:
+        bar_files = [create_bar_texture(name, width, height, exr, output_dir) for name in names]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            bar_files = list(executor.map(
+                create_bar_texture, names, [width] * count, [height] * count, [exr] * count, [output_dir] * count,
+                chunksize=max(1, count // (4 * jobs))
+            ))
+    print(f"Created {len(bar_files)} color bars ({width}x{height}) in {time.perf_counter() - start:.2f}s (jobs={jobs})")
+    return bar_files
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--names", type=str, nargs="+", default=None)
+    parser.add_argument("--width", type=int, default=256)
+    parser.add_argument("--height", type=int, default=1)
+    parser.add_argument("--exr", action="store_true", default=False)
+    parser.add_argument("--output_dir", type=str, default=bar_folder)
+    parser.add_argument("--jobs", type=int, default=1)
+    args = parser.parse_args()
+
     # for cmap_category, cmap_list in cmaps:
     #     plot_color_gradients(cmap_category, cmap_list)
-    create_bar_texture("RdYlGn_r")
\ No newline at end of file
+    # every map of every category (both orientations) unless names are given, e.g. --names RdYlGn_r
+    names = args.names
+    if names is None:
+        names = [name + suffix for _, cmap_list in cmaps for name in cmap_list for suffix in ("", "_r")]
+    create_bar_textures(names, args.width, args.height, args.exr, args.output_dir, args.jobs)
@@ -1,7 +1,120 @@
 import os
+import re
+import json
+import time
+import hashlib
 import argparse
+import threading
 import subprocess
-from process_image import write_gif, write_mp4, read_png
+from concurrent.futures import ThreadPoolExecutor
+from process_image import write_gif, write_mp4, load_frames
+
+def render_command(renderer_path, output_dir, mark, script_path):
+    return [
+        renderer_path,
+        f"-b CUDA",
+        f"-o \"{output_dir}\"",
+        f"-m {mark}",
+        f"-r",
+        f"\"{script_path}\"",
+    ]
+
+# string literals of a .luisa script that name existing files are its assets
+script_string = re.compile(r'"([^"\n]+)"')
+
+def script_assets(script_path):
+    with open(script_path, "r", errors="replace") as file:
+        text = file.read()
+    assets = set()
+    for value in script_string.findall(text):
+        for candidate in (value, os.path.join(os.path.dirname(script_path), value)):
+            if os.path.isfile(candidate):
+                assets.add(os.path.normpath(candidate))
+                break
+    return sorted(assets)
+
+def render_key(command, script_path):
+    # script content, renderer binary and arguments, and size/mtime of every referenced asset
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(script_path, "rb") as file:
+        hasher.update(file.read())
+    renderer = command[0]
+    if os.path.exists(renderer):
+        stat = os.stat(renderer)
+        hasher.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    hasher.update("\0".join(command).encode())
+    for asset in script_assets(script_path):
+        stat = os.stat(asset)
+        hasher.update(f"{asset}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return hasher.hexdigest()
+
+class RenderCache:
+    # Per output folder record of the key each image_<mark>.png was rendered with, and the size
+    # and mtime the image had then. Saved after every rendered frame so an interrupted run resumes.
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, ".render_cache.json")
+        self.entries = dict()
+        self.lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, "r") as file:
+                self.entries = json.load(file)
+
+    def is_current(self, mark, key, image):
+        entry = self.entries.get(mark)
+        if entry is None or entry["key"] != key or not os.path.exists(image):
+            return False
+        stat = os.stat(image)
+        return stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime"]
+
+    def record(self, mark, key, image):
+        stat = os.stat(image)
+        with self.lock:
+            self.entries[mark] = {"key": key, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as file:
+                json.dump(self.entries, file)
+            os.replace(temp_path, self.path)
+
+def render_frame(command, cache=None, mark=None, key=None, image=None):
+    print(" ".join(command))
+    returncode = subprocess.run(command).returncode
+    if cache is not None and returncode == 0 and os.path.exists(image):
+        cache.record(mark, key, image)
+    return returncode
+
+def render_frames(frames, renderer_path, output_dir, render_jobs=1, render=True, cache=None):
+    # frames is a list of (mark, script path). Up to render_jobs renderers run at once; the PNG of
+    # each frame is yielded in frame order as soon as it and all frames before it have finished,
+    # so whatever consumes the frames runs while later frames are still rendering. With a cache,
+    # frames whose image is up to date are not rendered again.
+    hits, renders, failures = 0, 0, 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(render_jobs, 1)) as executor:
+        futures = list()
+        for mark, script_path in frames:
+            real_img = os.path.join(output_dir, f"image_{mark}.png")
+            command = render_command(renderer_path, output_dir, mark, script_path)
+            future = None
+            if render:
+                key = None if cache is None else render_key(command, script_path)
+                if cache is not None and cache.is_current(mark, key, real_img):
+                    hits += 1
+                else:
+                    future = executor.submit(render_frame, command, cache, mark, key, real_img)
+                    renders += 1
+            futures.append(future)
+        for (mark, script_path), future in zip(frames, futures):
+            if future is not None:
+                returncode = future.result()
+                if returncode != 0:
+                    print(f"Renderer exited with {returncode} for {script_path}")
+                    failures += 1
+            real_img = os.path.join(output_dir, f"image_{mark}.png")
+            if os.path.exists(real_img):
+                yield real_img
+    if render:
+        print(f"Rendered {renders - failures}/{renders} frames ({hits} up to date) in "
+              f"{time.perf_counter() - start:.2f}s (render_jobs={render_jobs})")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -13,8 +126,11 @@ if __name__ == "__main__":
     parser.add_argument("--script_mark", type=str, default=None)
     parser.add_argument("--fps", type=int, default=60)
     parser.add_argument("--image_scale", type=float, default=1.0)
+    parser.add_argument("--render_jobs", type=int, default=1)
+    parser.add_argument("--load_jobs", type=int, default=4)
     parser.add_argument("--render_mp4", action="store_true", default=False)
     parser.add_argument("--no_render", action="store_true", default=False)
+    parser.add_argument("--no_cache", action="store_true", default=False)
     parser.add_argument("--no_zero", action="store_true", default=False)
     args = parser.parse_args()
 
@@ -24,43 +140,27 @@ if __name__ == "__main__":
         file_marks = [file[file.find("_") + 1: file.find(".")] for file in files]
         idx = [i for i in range(len(file_marks))]
         idx.sort(key=lambda x: int(file_marks[x]))
-        pngs = list()
         mark_start = 1 if args.no_zero else 0
-        for i in range(mark_start, len(file_marks)):
-            real_mark = f"{args.script_mark}_{file_marks[idx[i]]}"
-            if not args.no_render:
-            # if not True:
-                command = [
-                    args.renderer_path,
-                    f"-b CUDA",
-                    f"-o \"{args.output_dir}\"",
-                    f"-m {real_mark}",
-                    f"-r",
-                    f"\"{os.path.join(args.scripts_dir, files[idx[i]])}\"",
-                ]
-                print(" ".join(command))
-                result = subprocess.run(command)
-            real_img = os.path.join(args.output_dir, f"image_{real_mark}.png")
-            if os.path.exists(real_img):
-                pngs.append(real_img)
-        imgs = [read_png(png) for png in pngs]
+        frames = [
+            (f"{args.script_mark}_{file_marks[idx[i]]}", os.path.join(args.scripts_dir, files[idx[i]]))
+            for i in range(mark_start, len(file_marks))
+        ]
+        os.makedirs(args.output_dir, exist_ok=True)
+        cache = None if args.no_cache else RenderCache(args.output_dir)
+        pngs = render_frames(
+            frames, args.renderer_path, args.output_dir,
+            render_jobs=args.render_jobs, render=not args.no_render, cache=cache
+        )
+        # frames are decoded and scaled as they land, the encoders pull them from the generator
+        imgs = load_frames(pngs, scale=args.image_scale, jobs=args.load_jobs, read_ahead=2 * args.load_jobs)
         if args.render_mp4:
             mp4_file = os.path.join(args.output_dir, f"{args.script_mark}.mp4")
-            write_mp4(imgs, mp4_file, fps=args.fps, scale=args.image_scale)
+            write_mp4(imgs, mp4_file, fps=args.fps)
         else:
             gif_file = os.path.join(args.output_dir, f"{args.script_mark}.gif")
             write_gif(imgs, gif_file, fps=args.fps)
-        
+
     elif args.script_path is not None and args.script_mark is not None:
-        command = [
-            args.renderer_path,
-            f"-b CUDA",
-            f"-o \"{args.output_dir}\"",
-            f"-m {args.script_mark}",
-            f"-r",
-            f"\"{args.script_path}\"",
-        ]
-        print(" ".join(command))
-        result = subprocess.run(command)
+        render_frame(render_command(args.renderer_path, args.output_dir, args.script_mark, args.script_path))
     else:
         raise Exception("No script specified!")
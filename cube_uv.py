@@ -0,0 +1,118 @@
+import os
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from assets_lookup import cube_corner_uvs
+from mesh_cache import load_mesh, write_mesh_cache, mesh_cache_path
+from process_obj import write_obj, has_zup_tag
+
+# Cube atlas UVs without Blender: every triangle goes to the cube_corner_uvs rectangle of its
+# dominant normal direction, and its corners are placed by their position in the mesh bounding box.
+
+# cube_corner_uvs order: up, down, front, back, left, right
+cube_face_directions = [(2, 1), (2, -1), (0, 1), (0, -1), (1, -1), (1, 1)]    # (axis, sign)
+# (u axis, v axis) of each rectangle, see the comments of cube_corner_uvs
+cube_face_axes = np.array([(1, 0), (1, 0), (2, 1), (2, 1), (2, 0), (2, 0)])
+
+cube_uv_suffix = "_cube_uv"
+
+def classify_faces(vertices, faces):
+    # index into cube_corner_uvs of each face, by the largest component of its normal
+    corners = vertices[faces]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    axis = np.argmax(np.abs(normals), axis=1)
+    positive = np.take_along_axis(normals, axis[:, None], axis=1)[:, 0] >= 0
+    lookup = np.empty((3, 2), dtype=np.int64)      # [axis, positive] -> rectangle
+    for index, (direction_axis, sign) in enumerate(cube_face_directions):
+        lookup[direction_axis, int(sign > 0)] = index
+    return lookup[axis, positive.astype(np.int64)]
+
+def cube_uvs(vertices, faces):
+    # (F * 3, 2) UVs, one per face corner
+    low = vertices.min(axis=0)
+    extent = vertices.max(axis=0) - low
+    extent[extent == 0] = 1.0
+    relative = (vertices - low) / extent                         # (N, 3) in [0, 1]
+
+    rectangles = np.asarray(cube_corner_uvs, dtype=np.float64)  # (6, 2 corners, 2)
+    face_class = classify_faces(vertices, faces)
+    corner_class = np.repeat(face_class, 3)
+    corner_relative = relative[faces.reshape(-1)]
+    axes = cube_face_axes[corner_class]
+    t = np.take_along_axis(corner_relative, axes, axis=1)        # (F * 3, 2)
+    start = rectangles[corner_class, 0]
+    end = rectangles[corner_class, 1]
+    return start + (end - start) * t, face_class
+
+def generate_cube_uv(obj_file, output_file=None):
+    output_file = f"{os.path.splitext(obj_file)[0]}{cube_uv_suffix}.obj" if output_file is None else output_file
+    mesh = load_mesh(obj_file)
+    vertices = np.asarray(mesh.vertices, dtype=np.float64)
+    faces = np.asarray(mesh.faces, dtype=np.int64)
+    uvs, face_class = cube_uvs(vertices, faces)
+
+    # corners are unmerged, a vertex on a cube edge needs a different UV on each side
+    corner_vertices = vertices[faces.reshape(-1)]
+    corner_normals = None
+    if mesh.vertex_normals is not None:
+        corner_normals = np.asarray(mesh.vertex_normals)[faces.reshape(-1)]
+    corner_faces = np.arange(faces.size, dtype=np.int64).reshape(-1, 3)
+    write_obj(
+        output_file, corner_vertices, corner_faces, vertex_normals=corner_normals, uvs=uvs,
+        add_zup=has_zup_tag(obj_file)
+    )
+    write_mesh_cache(
+        mesh_cache_path(output_file), corner_vertices, corner_faces, corner_normals, uvs, source=output_file
+    )
+    print(f"Cube UVs of {obj_file} ({len(faces)} faces, {np.bincount(face_class, minlength=6).tolist()} "
+          f"up/down/front/back/left/right) written to {output_file}")
+    return output_file
+
+def find_cube_uv_sources(roots):
+    file_paths = list()
+    for root in roots:
+        if os.path.isfile(root):
+            file_paths.append(root)
+            continue
+        for dir_path, dirnames, filenames in os.walk(root):
+            for filename in sorted(filenames):
+                if filename.endswith(".obj") and not filename.endswith(f"{cube_uv_suffix}.obj"):
+                    file_paths.append(os.path.join(dir_path, filename))
+    return file_paths
+
+def batch_cube_uv(file_paths, jobs=1):
+    start = time.perf_counter()
+    failures = list()
+    if jobs <= 1:
+        for file_path in file_paths:
+            try:
+                generate_cube_uv(file_path)
+            except Exception as e:
+                failures.append((file_path, repr(e)))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(generate_cube_uv, file_path): file_path for file_path in file_paths}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failures.append((futures[future], repr(e)))
+    elapsed = time.perf_counter() - start
+    rate = len(file_paths) / elapsed if elapsed > 0 else 0.0
+    print(f"Generated cube UVs for {len(file_paths) - len(failures)}/{len(file_paths)} meshes in {elapsed:.2f}s "
+          f"({rate:.2f} files/s, jobs={jobs})")
+    for file_path, error in sorted(failures):
+        print(f"    FAILED {file_path}: {error}")
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", type=str, nargs="+", required=True)
+    parser.add_argument("--jobs", type=int, default=1)
+    args = parser.parse_args()
+
+    failures = batch_cube_uv(find_cube_uv_sources(args.path), jobs=args.jobs)
+    if len(failures) > 0:
+        raise SystemExit(1)
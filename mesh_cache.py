@@ -0,0 +1,277 @@
+import os
+import struct
+import hashlib
+import numpy as np
+
+# Binary sidecar stored next to an exported OBJ: a 64 byte header followed by raw float32
+# vertices, [normals], [uvs] and uint32 faces, so np.memmap can map it without parsing.
+#
+#   magic          8s   b"ALMESH\0\0"
+#   version        I
+#   flags          I    bit 0: normals, bit 1: uvs
+#   vertex_count   Q
+#   face_count     Q
+#   source_size    Q    size of the OBJ the cache was written for
+#   source_mtime   q    st_mtime_ns of that OBJ
+#   content_hash   16s  blake2b-128 of the payload
+mesh_cache_magic = b"ALMESH\0\0"
+mesh_cache_version = 1
+mesh_cache_header = struct.Struct("<8sIIQQQq16s")
+mesh_cache_extension = ".meshbin"
+
+has_normals_flag = 1
+has_uvs_flag = 2
+
+class MeshData:
+    def __init__(self, vertices, faces, vertex_normals=None, uvs=None):
+        self.vertices       = vertices
+        self.faces          = faces
+        self.vertex_normals = vertex_normals
+        self.uvs            = uvs
+
+def mesh_cache_path(obj_file):
+    return os.path.splitext(obj_file)[0] + mesh_cache_extension
+
+def mesh_cache_arrays(vertices, faces, vertex_normals=None, uvs=None):
+    arrays = [np.ascontiguousarray(vertices, dtype="<f4").reshape((-1, 3))]
+    flags = 0
+    if vertex_normals is not None:
+        arrays.append(np.ascontiguousarray(vertex_normals, dtype="<f4").reshape((-1, 3)))
+        flags |= has_normals_flag
+    if uvs is not None:
+        arrays.append(np.ascontiguousarray(uvs, dtype="<f4").reshape((-1, 2)))
+        flags |= has_uvs_flag
+    arrays.append(np.ascontiguousarray(faces, dtype="<u4").reshape((-1, 3)))
+    return arrays, flags
+
+def content_hash(arrays):
+    hasher = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        hasher.update(memoryview(array).cast("B"))
+    return hasher.digest()
+
+def write_mesh_cache(path, vertices, faces, vertex_normals=None, uvs=None, source=None):
+    arrays, flags = mesh_cache_arrays(vertices, faces, vertex_normals, uvs)
+    source_size, source_mtime = 0, 0
+    if source is not None:
+        stat = os.stat(source)
+        source_size, source_mtime = stat.st_size, stat.st_mtime_ns
+    header = mesh_cache_header.pack(
+        mesh_cache_magic, mesh_cache_version, flags,
+        arrays[0].shape[0], arrays[-1].shape[0],
+        source_size, source_mtime, content_hash(arrays)
+    )
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(header)
+        for array in arrays:
+            file.write(memoryview(array).cast("B"))
+    os.replace(temp_path, path)
+    return path
+
+def read_mesh_cache_header(path):
+    with open(path, "rb") as file:
+        data = file.read(mesh_cache_header.size)
+    if len(data) < mesh_cache_header.size:
+        raise Exception(f"Truncated mesh cache: {path}")
+    magic, version, flags, vertex_count, face_count, source_size, source_mtime, digest = \
+        mesh_cache_header.unpack(data)
+    if magic != mesh_cache_magic or version != mesh_cache_version:
+        raise Exception(f"Invalid mesh cache: {path}")
+    return {
+        "flags": flags,
+        "vertex_count": vertex_count,
+        "face_count": face_count,
+        "source_size": source_size,
+        "source_mtime": source_mtime,
+        "hash": digest,
+    }
+
+def is_mesh_cache_current(path, source):
+    # O(stat): the cache is trusted while the OBJ keeps the size and mtime it was written for
+    if not os.path.exists(path):
+        return False
+    try:
+        header = read_mesh_cache_header(path)
+    except Exception:
+        return False
+    stat = os.stat(source)
+    return header["source_size"] == stat.st_size and header["source_mtime"] == stat.st_mtime_ns
+
+def load_mesh_cache(path, mode="r", verify=False):
+    header = read_mesh_cache_header(path)
+    n, m = header["vertex_count"], header["face_count"]
+    buffer = np.memmap(path, dtype=np.uint8, mode=mode)
+    offset = mesh_cache_header.size
+
+    def take(dtype, shape):
+        nonlocal offset
+        size = int(np.prod(shape)) * 4
+        array = buffer[offset: offset + size].view(dtype).reshape(shape)
+        offset += size
+        return array
+
+    vertices = take("<f4", (n, 3))
+    vertex_normals = take("<f4", (n, 3)) if header["flags"] & has_normals_flag else None
+    uvs = take("<f4", (n, 2)) if header["flags"] & has_uvs_flag else None
+    faces = take("<u4", (m, 3))
+    if verify:
+        arrays = [a for a in (vertices, vertex_normals, uvs, faces) if a is not None]
+        if content_hash(arrays) != header["hash"]:
+            raise Exception(f"Mesh cache content hash mismatch: {path}")
+    return MeshData(vertices, faces, vertex_normals, uvs)
+
+def update_mesh_cache_header(path, source=None):
+    # refreshes hash and source stat after the payload was modified in place
+    header = read_mesh_cache_header(path)
+    mesh = load_mesh_cache(path)
+    arrays = [a for a in (mesh.vertices, mesh.vertex_normals, mesh.uvs, mesh.faces) if a is not None]
+    digest = content_hash(arrays)
+    del mesh, arrays
+    source_size, source_mtime = header["source_size"], header["source_mtime"]
+    if source is not None:
+        stat = os.stat(source)
+        source_size, source_mtime = stat.st_size, stat.st_mtime_ns
+    data = mesh_cache_header.pack(
+        mesh_cache_magic, mesh_cache_version, header["flags"],
+        header["vertex_count"], header["face_count"],
+        source_size, source_mtime, digest
+    )
+    with open(path, "r+b") as file:
+        file.write(data)
+
+class ObjRecords:
+    # Collects the v/vn/vt/f records of an OBJ chunk by chunk (see fix_zup) and builds the arrays
+    # of its sidecar with NumPy. Corners whose v/vt/vn indices differ are split into unique
+    # vertices like trimesh does; polygons are fanned into triangles. build() returns None for
+    # what it does not handle (relative indices, mixed corner formats), parse_obj then uses trimesh.
+    def __init__(self):
+        self.vertices = list()
+        self.normals = list()
+        self.uvs = list()
+        self.corners = list()       # (F, 3, 3) int64 arrays of 1-based v, vt, vn, 0 when absent
+        self.supported = True
+
+    def add_lines(self, lines):
+        groups = {"v ": list(), "vn": list(), "vt": list(), "f ": list()}
+        for line in lines:
+            group = groups.get(line[:2])
+            if group is not None:
+                group.append(line)
+        for key, target, width in (("v ", self.vertices, 3), ("vn", self.normals, 3), ("vt", self.uvs, 2)):
+            if len(groups[key]) > 0:
+                target.append(parse_records(groups[key], key.strip(), np.float32)[:, :width])
+        faces = groups["f "]
+        if len(faces) == 0:
+            return
+        # faces usually all have the same corner count and parse as one block, mixed ones are grouped
+        count = faces[0].count(" ")
+        if faces[0].endswith(" \n") or any(line.count(" ") != count for line in faces):
+            polygons = dict()
+            for line in faces:
+                corners = line.split()[1:]
+                polygons.setdefault(len(corners), list()).append(" ".join(corners) + "\n")
+        else:
+            polygons = {count: [line[2:] for line in faces]}
+        for count, group in polygons.items():
+            if count < 3:
+                continue
+            text = "".join(group).replace("//", "/0/")
+            fields = group[0].split(None, 1)[0].replace("//", "/0/").count("/") + 1
+            indices = np.fromstring(text.replace("/", " "), dtype=np.int64, sep=" ")
+            size = len(group) * count
+            if text.count("/") != size * (fields - 1) or indices.size != size * fields or "-" in text:
+                self.supported = False
+                return
+            indices = indices.reshape(len(group), count, fields)
+            if fields < 3:
+                indices = np.concatenate([indices, np.zeros((len(group), count, 3 - fields), np.int64)], axis=2)
+            for i in range(1, count - 1):
+                self.corners.append(indices[:, [0, i, i + 1]])
+
+    def build(self):
+        if not self.supported or len(self.vertices) == 0 or len(self.corners) == 0:
+            return None
+        vertices = np.concatenate(self.vertices)
+        corners = np.concatenate(self.corners).reshape(-1, 3) - 1
+        v, vt, vn = corners[:, 0], corners[:, 1], corners[:, 2]
+        uvs = np.concatenate(self.uvs) if len(self.uvs) > 0 and (vt >= 0).all() else None
+        normals = np.concatenate(self.normals) if len(self.normals) > 0 and (vn >= 0).all() else None
+        if (uvs is None or np.array_equal(vt, v) and len(uvs) == len(vertices)) and \
+                (normals is None or np.array_equal(vn, v) and len(normals) == len(vertices)):
+            faces = v
+        else:
+            keys = np.stack([v, vt if uvs is not None else 0 * v, vn if normals is not None else 0 * v], axis=1)
+            unique, faces = np.unique(keys, axis=0, return_inverse=True)
+            vertices = vertices[unique[:, 0]]
+            uvs = None if uvs is None else uvs[unique[:, 1]]
+            normals = None if normals is None else normals[unique[:, 2]]
+        faces = faces.reshape(-1, 3).astype(np.uint32)
+        if normals is None:
+            normals = vertex_normals(vertices, faces)
+        return MeshData(vertices, faces, normals, uvs)
+
+def parse_records(lines, keyword, dtype):
+    # values of records sharing a keyword, rows padded with zeros when their widths differ
+    values = np.fromstring("".join(lines).replace(keyword, " "), dtype=dtype, sep=" ")
+    width = len(lines[0].split()) - 1
+    if values.size == width * len(lines):
+        return values.reshape(len(lines), width)
+    rows = [line.split()[1:] for line in lines]
+    width = max(len(row) for row in rows)
+    return np.array([row + ["0"] * (width - len(row)) for row in rows], dtype=dtype)
+
+def vertex_normals(vertices, faces):
+    # area weighted sum of the adjacent face normals
+    corners = vertices[faces]
+    face_normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    normals = np.zeros_like(vertices)
+    for k in range(3):
+        np.add.at(normals, faces[:, k], face_normals)
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    lengths[lengths == 0] = 1.0
+    return (normals / lengths).astype(np.float32)
+
+# lines read per chunk, as in process_obj
+obj_chunk_lines = 1 << 16
+
+def parse_obj(obj_file):
+    from itertools import islice
+
+    records = ObjRecords()
+    with open(obj_file, "r", errors="replace") as file:
+        while True:
+            lines = list(islice(file, obj_chunk_lines))
+            if len(lines) == 0:
+                break
+            records.add_lines(lines)
+    mesh = records.build()
+    return parse_obj_trimesh(obj_file) if mesh is None else mesh
+
+def parse_obj_trimesh(obj_file):
+    import trimesh
+
+    mesh = trimesh.load_mesh(obj_file, skip_material=True, process=False)
+    uvs = getattr(mesh.visual, "uv", None)
+    return MeshData(
+        np.asarray(mesh.vertices, dtype=np.float32),
+        np.asarray(mesh.faces, dtype=np.uint32),
+        np.asarray(mesh.vertex_normals, dtype=np.float32),
+        None if uvs is None else np.asarray(uvs, dtype=np.float32),
+    )
+
+def ensure_mesh_cache(obj_file, records=None):
+    # writes the sidecar unless it is up to date, from the records already read when given
+    cache_file = mesh_cache_path(obj_file)
+    if not is_mesh_cache_current(cache_file, obj_file):
+        mesh = None if records is None else records.build()
+        mesh = parse_obj(obj_file) if mesh is None else mesh
+        write_mesh_cache(cache_file, mesh.vertices, mesh.faces, mesh.vertex_normals, mesh.uvs, source=obj_file)
+    return cache_file
+
+def load_mesh(obj_file):
+    # the sidecar when it is up to date, otherwise a full OBJ parse
+    cache_file = mesh_cache_path(obj_file)
+    if is_mesh_cache_current(cache_file, obj_file):
+        return load_mesh_cache(cache_file)
+    return parse_obj(obj_file)
@@ -0,0 +1,204 @@
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from asset_manifest import AssetManifest
+
+# Per-file stage functions, run in worker processes. Each returns the files it produced so that
+# downstream stages can pick them up as soon as they exist.
+def extract_glb(file_path):
+    from process_glb import convert_glb
+
+    return convert_glb(file_path)
+
+def fix_obj_zup(file_path):
+    from process_obj import fix_zup
+
+    fix_zup(file_path)
+    return [file_path]
+
+def recompress_exr(file_path):
+    import Imath
+    from process_exr import change_compression_type
+
+    change_compression_type(file_path, Imath.Compression.PIZ_COMPRESSION)
+    return [file_path]
+
+def build_levels(file_path):
+    from texture_pyramid import build_pyramid
+
+    return build_pyramid(file_path)
+
+def timed(function, file_path):
+    start = time.perf_counter()
+    outputs = function(file_path)
+    return outputs, time.perf_counter() - start
+
+def walk_files(roots, extensions):
+    file_paths = list()
+    for root in roots:
+        for dir_path, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            for filename in sorted(filenames):
+                if filename.startswith("."):
+                    continue
+                if len(extensions) == 0 or filename.lower().endswith(extensions):
+                    file_paths.append(os.path.relpath(os.path.join(dir_path, filename)))
+    return file_paths
+
+# paths are kept relative to the working directory, so files found on disk, task outputs and
+# manifest entries compare equal
+def glb_output_prefix(file_path):
+    # convert_glb writes next to the GLB into a folder named after it
+    return os.path.splitext(file_path)[0] + os.sep
+
+def tool_version(module, name):
+    return getattr(__import__(module), name)
+
+class Stage:
+    def __init__(self, name, function, roots, extensions, deps, tool, version, output_prefix=None):
+        self.name = name
+        self.function = function
+        self.roots = roots
+        self.extensions = extensions
+        self.deps = deps
+        self.tool = tool
+        self.version = version
+        # where the outputs of a task will appear, so downstream stages do not start on files an
+        # upstream task is about to rewrite
+        self.output_prefix = (lambda file_path: file_path) if output_prefix is None else output_prefix
+
+    def accepts(self, file_path):
+        return file_path.lower().endswith(self.extensions)
+
+# the manifests are shared with the standalone scripts, a file processed by either is current for both
+stages = [
+    Stage("glb", extract_glb, ["./assets/models/glb/"], (".glb",), [],
+          "glb", lambda: tool_version("process_glb", "glb_tool_version"), glb_output_prefix),
+    Stage("zup", fix_obj_zup, ["./assets/models/"], (".obj",), ["glb"],
+          "obj", lambda: tool_version("process_obj", "obj_tool_version")),
+    Stage("exr", recompress_exr, ["./assets/textures/", "./assets/models/"], (".exr",), [],
+          "exr", lambda: tool_version("process_exr", "exr_tool_version")),
+    Stage("pyramid", build_levels, ["./assets/textures/", "./assets/backgrounds/", "./assets/models/"],
+          (".png", ".jpg", ".jpeg", ".exr", ".hdr"), ["glb", "exr"],
+          "pyramid", lambda: "{}-{}".format(
+              tool_version("texture_pyramid", "pyramid_tool_version"),
+              "-".join(map(str, sorted(tool_version("texture_pyramid", "pyramid_levels"), reverse=True)))
+          )),
+]
+
+class StageReport:
+    def __init__(self):
+        self.done = 0
+        self.skipped = 0
+        self.failures = list()
+        self.busy = 0.0             # summed task time in the workers
+        self.first_start = None
+        self.last_end = None
+
+def run_pipeline(selected, jobs=1, force=False):
+    # Files are scheduled per stage as soon as their inputs are ready: a file found on disk is
+    # ready unless an active upstream stage is going to write it, in which case it is submitted
+    # when that upstream task finishes. All stages share one worker pool.
+    active = [stage for stage in stages if stage.name in selected]
+    manifests = {stage.name: AssetManifest(stage.tool, stage.version()) for stage in active}
+    if force:
+        for manifest in manifests.values():
+            manifest.entries.clear()
+    reports = {stage.name: StageReport() for stage in active}
+    scheduled = {stage.name: set() for stage in active}
+    downstream = {stage.name: [s for s in active if stage.name in s.deps] for stage in active}
+    pending_prefixes = {stage.name: dict() for stage in active}     # stage -> {file: output prefix}
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = dict()
+
+        def submit(stage, file_path):
+            if file_path in scheduled[stage.name]:
+                return
+            scheduled[stage.name].add(file_path)
+            report = reports[stage.name]
+            if manifests[stage.name].is_current(file_path):
+                report.skipped += 1
+                # nothing changes, downstream stages still look at the outputs
+                for next_stage in downstream[stage.name]:
+                    for output in manifests[stage.name].entries[manifests[stage.name].key(file_path)]["outputs"]:
+                        output = os.path.relpath(manifests[stage.name].resolve(output))
+                        if next_stage.accepts(output) and not is_claimed(next_stage, output):
+                            submit(next_stage, output)
+                return
+            if report.first_start is None:
+                report.first_start = time.perf_counter()
+            pending_prefixes[stage.name][file_path] = stage.output_prefix(file_path)
+            futures[executor.submit(timed, stage.function, file_path)] = (stage, file_path)
+
+        def is_claimed(stage, file_path):
+            for dep in stage.deps:
+                if dep in pending_prefixes:
+                    if any(file_path.startswith(prefix) for prefix in pending_prefixes[dep].values()):
+                        return True
+            return False
+
+        # upstream stages first, so their claims are known before downstream files are discovered
+        for stage in active:
+            for file_path in walk_files(stage.roots, stage.extensions):
+                if not is_claimed(stage, file_path):
+                    submit(stage, file_path)
+
+        while len(futures) > 0:
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, file_path = futures.pop(future)
+                report = reports[stage.name]
+                report.last_end = time.perf_counter()
+                try:
+                    outputs, seconds = future.result()
+                except Exception as e:
+                    report.failures.append((file_path, repr(e)))
+                    manifests[stage.name].forget(file_path)
+                    del pending_prefixes[stage.name][file_path]
+                    continue
+                report.done += 1
+                report.busy += seconds
+                manifests[stage.name].record(file_path, outputs)
+                prefix = pending_prefixes[stage.name].pop(file_path)
+                # files left in an output folder from earlier runs were held back as well
+                candidates = list(outputs)
+                if prefix.endswith(os.sep) and os.path.isdir(prefix):
+                    candidates += walk_files([prefix], tuple())
+                for next_stage in downstream[stage.name]:
+                    for output in candidates:
+                        output = os.path.relpath(output)
+                        if next_stage.accepts(output) and not is_claimed(next_stage, output):
+                            submit(next_stage, output)
+
+    for manifest in manifests.values():
+        manifest.save()
+    elapsed = time.perf_counter() - start
+
+    print(f"Pipeline finished in {elapsed:.2f}s (jobs={jobs})")
+    for stage in active:
+        report = reports[stage.name]
+        span = 0.0 if report.first_start is None else report.last_end - report.first_start
+        print(f"    {stage.name:<8} {report.done} done, {report.skipped} unchanged, {len(report.failures)} failed, "
+              f"{report.busy:.2f}s busy over {span:.2f}s")
+    failures = [(stage.name, f, e) for stage in active for f, e in reports[stage.name].failures]
+    for name, file_path, error in sorted(failures):
+        print(f"    FAILED {name} {file_path}: {error}")
+    return failures
+
+if __name__ == "__main__":
+    stage_names = [stage.name for stage in stages]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", type=str, nargs="+", default=None, choices=stage_names)
+    parser.add_argument("--skip", type=str, nargs="+", default=[], choices=stage_names)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--force", action="store_true", default=False)
+    args = parser.parse_args()
+
+    selected = [name for name in (stage_names if args.only is None else args.only) if name not in args.skip]
+    failures = run_pipeline(selected, jobs=args.jobs, force=args.force)
+    if len(failures) > 0:
+        raise SystemExit(1)
@@ -2,6 +2,11 @@ import OpenEXR
 import Imath
 import argparse
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from asset_manifest import AssetManifest
+
+exr_tool_version = 1
 
 # Imath.Compression.NO_COMPRESSION: No compression
 # Imath.Compression.RLE_COMPRESSION: Run Length Encoding (RLE)
@@ -13,23 +18,103 @@ import os
 # Imath.Compression.B44A_COMPRESSION: B44A compression
 # Imath.Compression.DWAA_COMPRESSION: DWAA compression
 # Imath.Compression.DWAB_COMPRESSION: DWAB compression
-def change_compression_type(filename, new_type):
+def change_compression_type(filename, new_type, block_bytes=64 << 20):
+    # Streams blocks of scanlines into a temp file next to the source and renames it over the
+    # source, so at most ~block_bytes of pixels are resident and a crash leaves the original intact.
+    # Returns the file size before and after, equal when nothing had to be done.
     input_file = OpenEXR.InputFile(filename)
     header = input_file.header()
     old_comp = header['compression']
+    old_size = os.path.getsize(filename)
     if old_comp.v == new_type:
-        return
-    
+        input_file.close()
+        return old_size, old_size
+
     new_comp = Imath.Compression(new_type)
     print(f"Change {filename}'s compression type from {old_comp} to {new_comp}")
-    pixels = { c: input_file.channel(c) for c in header["channels"] }
-    input_file.close()
+    dw = header['dataWindow']
+    width = dw.max.x - dw.min.x + 1
+    channels = header['channels']
+    line_bytes = width * sum(2 if str(channels[c].type) == "HALF" else 4 for c in channels)
+    # a multiple of 32 lines, the largest scanline group of any compression (PIZ, B44, DWAA)
+    block_lines = max(32, block_bytes // max(line_bytes, 1) // 32 * 32)
+
     header['compression'] = new_comp
-    output_file = OpenEXR.OutputFile(filename, header)
-    output_file.writePixels(pixels)
-    output_file.close()
-    # print(type(compression_type), compression_type, DWAA_COMPRESSION)
-    
+    # tiled sources are rewritten as scanline files, InputFile serves their tiles as scanlines
+    header.pop('tiles', None)
+    # not named *.exr, so a temp file left behind by a killed run is never picked up as an asset
+    temp_file = f"{filename}.tmp"
+    try:
+        output_file = OpenEXR.OutputFile(temp_file, header)
+        for y0 in range(dw.min.y, dw.max.y + 1, block_lines):
+            y1 = min(y0 + block_lines, dw.max.y + 1) - 1
+            pixels = {c: input_file.channel(c, channels[c].type, y0, y1) for c in channels}
+            output_file.writePixels(pixels, y1 - y0 + 1)
+        output_file.close()
+        input_file.close()
+        os.replace(temp_file, filename)
+    except BaseException:
+        input_file.close()
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    return old_size, os.path.getsize(filename)
+
+def find_exr_files(root):
+    file_paths = list()
+    for dir_path, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(".exr"):
+                file_paths.append(os.path.join(dir_path, filename))
+    return sorted(file_paths)
+
+def batch_recompress(file_paths, new_type, jobs=1, manifest=None):
+    start = time.perf_counter()
+    if manifest is not None:
+        pending = [file_path for file_path in file_paths if not manifest.is_current(file_path)]
+    else:
+        pending = list(file_paths)
+    failures = list()
+    bytes_before, bytes_after = 0, 0
+
+    def on_done(file_path, sizes):
+        nonlocal bytes_before, bytes_after
+        bytes_before += sizes[0]
+        bytes_after += sizes[1]
+        if manifest is not None:
+            manifest.record(file_path)
+
+    if jobs <= 1:
+        for file_path in pending:
+            try:
+                on_done(file_path, change_compression_type(file_path, new_type))
+            except Exception as e:
+                failures.append((file_path, repr(e)))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(change_compression_type, file_path, new_type): file_path
+                for file_path in pending
+            }
+            for future in as_completed(futures):
+                try:
+                    on_done(futures[future], future.result())
+                except Exception as e:
+                    failures.append((futures[future], repr(e)))
+    if manifest is not None:
+        for file_path, error in failures:
+            manifest.forget(file_path)
+        manifest.save()
+    elapsed = time.perf_counter() - start
+
+    done = len(pending) - len(failures)
+    skipped = len(file_paths) - len(pending)
+    rate = bytes_before / elapsed / 1e6 if elapsed > 0 else 0.0
+    print(f"Recompressed {done}/{len(pending)} EXR files ({skipped} unchanged) in {elapsed:.2f}s "
+          f"({rate:.1f} MB/s, jobs={jobs}): {bytes_before / 1e6:.1f} MB -> {bytes_after / 1e6:.1f} MB")
+    for file_path, error in sorted(failures):
+        print(f"    FAILED {file_path}: {error}")
+    return failures
 
 
 if __name__ == "__main__":
@@ -37,20 +122,22 @@ if __name__ == "__main__":
     parser.add_argument("--check_all_textures", action="store_true", default=False)
     parser.add_argument("--check_all_models", action="store_true", default=False)
     parser.add_argument("--path", type=str, default=None)
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--force", action="store_true", default=False)
     args = parser.parse_args()
     
     # test_file = "./assets/textures/fabric_pattern_05/textures/fabric_pattern_05_nor_gl_4k.exr"
     if args.check_all_textures or args.check_all_models:
+        manifest = AssetManifest("exr", exr_tool_version)
+        if args.force:
+            manifest.entries.clear()
         if args.check_all_textures:
-            walks = os.walk("./assets/textures/")
+            file_paths = find_exr_files("./assets/textures/")
         else:
-            walks = os.walk("./assets/models/")
-        for dir_path, dirnames, filenames in walks:
-            for filename in filenames:
-                if filename.endswith(".exr"):
-                    file_path = os.path.join(dir_path, filename)
-                    change_compression_type(file_path, Imath.Compression.PIZ_COMPRESSION)
-			# relative_dirpath = dirpath[len(root_dir):]
+            file_paths = find_exr_files("./assets/models/")
+        failures = batch_recompress(file_paths, Imath.Compression.PIZ_COMPRESSION, jobs=args.jobs, manifest=manifest)
+        if len(failures) > 0:
+            raise SystemExit(1)
     else:
         file_path = args.path
-        change_compression_type(file_path, Imath.Compression.PIZ_COMPRESSION)
\ No newline at end of file
+        change_compression_type(file_path, Imath.Compression.PIZ_COMPRESSION)
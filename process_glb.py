@@ -1,4 +1,7 @@
 import os
+import json
+import time
+import threading
 import numpy as np
 import base64
 import trimesh
@@ -6,8 +9,18 @@ from PIL import Image
 from io import BytesIO
 import pygltflib
 import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
-from process_obj import export_without_mtl
+from process_obj import write_obj
+from mesh_cache import write_mesh_cache, mesh_cache_path
+from asset_manifest import AssetManifest
+
+# bump whenever the exported files change for the same input
+glb_tool_version = 6
+
+# channels of orm_<index>.png, the glTF occlusion / metallicRoughness layout (R is unused
+# when the material has no occlusion texture); the split files are read from the same channels
+orm_layout = {"occlusion": "R", "roughness": "G", "metallic": "B"}
 
 class GLBObject:
     def __init__(self,
@@ -25,27 +38,232 @@ class GLBObject:
         self.uvs               = uvs
         self.material          = material
 
+class GLBImage:
+    # Encoded PNG/JPEG bytes of a glTF image, sliced from its bufferView without copying.
+    # Pixels are only decoded on first use and shared by every material referencing them.
+    def __init__(self, data, mime_type=None):
+        self.data = data
+        self.mime_type = mime_type if mime_type is not None else sniff_mime_type(data)
+        self.decoded = None
+        self.lock = threading.Lock()
+
+    def decode(self):
+        with self.lock:
+            if self.decoded is None:
+                self.decoded = Image.open(BytesIO(self.data)).convert("RGBA")
+            return self.decoded
+
 class GLBMaterial:
     def __init__(self,
-        image_texture,
-        metallic_texture,
-        roughness_texture
+        color_source=None,
+        color_factor=None,
+        metallic_roughness_source=None,
+        metallic_factor=None,
+        roughness_factor=None,
+        occlusion_source=None,
+        occlusion_strength=None,
     ):
-        self.image_texture     = image_texture
-        self.metallic_texture  = metallic_texture
-        self.roughness_texture = roughness_texture
+        self.color_source              = color_source
+        self.color_factor              = color_factor
+        self.metallic_roughness_source = metallic_roughness_source
+        self.metallic_factor           = metallic_factor
+        self.roughness_factor          = roughness_factor
+        self.occlusion_source          = occlusion_source
+        self.occlusion_strength        = occlusion_strength
+
+    # without a texture the factor alone describes the channel, and is exported as a constant
+    @property
+    def color_constant(self):
+        if self.color_source is not None:
+            return None
+        return [1.0, 1.0, 1.0, 1.0] if self.color_factor is None else list(self.color_factor)
+
+    @property
+    def metallic_constant(self):
+        if self.metallic_roughness_source is not None:
+            return None
+        return 1.0 if self.metallic_factor is None else self.metallic_factor
+
+    @property
+    def roughness_constant(self):
+        if self.metallic_roughness_source is not None:
+            return None
+        return 1.0 if self.roughness_factor is None else self.roughness_factor
+
+    def color_passthrough(self):
+        # the source bytes can be written as they are when no pixel has to change
+        if self.color_source is None or self.color_source.mime_type != "image/png":
+            return None
+        if not is_identity(self.color_factor):
+            return None
+        return self.color_source.data
+
+    @property
+    def image_texture(self):
+        if self.color_source is None:
+            return None
+        color_image = self.color_source.decode()
+        if is_identity(self.color_factor):
+            return color_image
+        return Image.fromarray(bake_factors(np.asarray(color_image), self.color_factor), "RGBA")
+
+    def metallic_roughness_textures(self):
+        if self.metallic_roughness_source is None:
+            return None, None
+        # glTF layout: G for roughness, B for metallic, both scaled in a single pass
+        pixels = np.asarray(self.metallic_roughness_source.decode())[:, :, 1:3]
+        factors = [
+            1.0 if self.roughness_factor is None else self.roughness_factor,
+            1.0 if self.metallic_factor is None else self.metallic_factor,
+        ]
+        if not is_identity(factors):
+            pixels = bake_factors(pixels, factors)
+        return (
+            Image.fromarray(np.ascontiguousarray(pixels[:, :, 1]), "L"),
+            Image.fromarray(np.ascontiguousarray(pixels[:, :, 0]), "L"),
+        )
+
+    @property
+    def has_orm(self):
+        return self.metallic_roughness_source is not None or self.occlusion_source is not None
+
+    @property
+    def occlusion_identity(self):
+        return self.occlusion_strength is None or self.occlusion_strength == 1.0
+
+    def orm_channels(self):
+        # which channel of orm_<index>.png holds what, occlusion is None when R carries nothing
+        return dict(orm_layout, occlusion=None if self.occlusion_source is None else orm_layout["occlusion"])
+
+    def orm_passthrough(self):
+        # glTF already packs roughness in G and metallic in B, and often the occlusion in R of the
+        # same image, so the source bytes are the ORM texture whenever no factor has to be baked
+        source = self.metallic_roughness_source
+        if source is None or source.mime_type != "image/png":
+            return None
+        if not is_identity([f for f in (self.metallic_factor, self.roughness_factor) if f is not None]):
+            return None
+        if self.occlusion_source is not None and (self.occlusion_source is not source or not self.occlusion_identity):
+            return None
+        return source.data
+
+    def orm_texture(self):
+        if not self.has_orm:
+            return None
+        if self.metallic_roughness_source is not None:
+            pixels = np.array(self.metallic_roughness_source.decode())[:, :, :3]
+            factors = [
+                1.0,
+                1.0 if self.roughness_factor is None else self.roughness_factor,
+                1.0 if self.metallic_factor is None else self.metallic_factor,
+            ]
+            if not is_identity(factors):
+                pixels = bake_factors(pixels, factors)
+        else:
+            size = self.occlusion_source.decode().size
+            pixels = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            pixels[:, :] = constant_pixels([1.0, self.roughness_constant, self.metallic_constant])
+        height, width = pixels.shape[:2]
+        if self.occlusion_source is None:
+            pixels[:, :, 0] = 255
+        elif self.occlusion_source is not self.metallic_roughness_source or not self.occlusion_identity:
+            occlusion = self.occlusion_source.decode()
+            if occlusion.size != (width, height):
+                occlusion = occlusion.resize((width, height), Image.BILINEAR)
+            occlusion = np.asarray(occlusion)[:, :, 0]
+            if not self.occlusion_identity:
+                # glTF: occluded = 1 + strength * (texel - 1)
+                strength = np.float32(self.occlusion_strength)
+                occlusion = np.float32(255.0) + strength * (occlusion.astype(np.float32) - np.float32(255.0))
+                occlusion = np.clip(np.rint(occlusion), 0, 255).astype(np.uint8)
+            pixels[:, :, 0] = occlusion
+        return Image.fromarray(pixels, "RGB")
+
+    @property
+    def metallic_texture(self):
+        return self.metallic_roughness_textures()[0]
+
+    @property
+    def roughness_texture(self):
+        return self.metallic_roughness_textures()[1]
+
+# zlib settings of the PNG profiles, PIL's default is level 6. Whatever the profile, a PNG source
+# whose pixels are not changed is written as it is ("raw").
+texture_profiles = {
+    "default": dict(),
+    "fast": {"compress_level": 1},
+    "small": {"optimize": True},        # level 9 and a search for the smallest filter
+}
+
+class TextureEncoder:
+    # Writes exported textures on a thread pool (PIL releases the GIL in zlib) and reports the
+    # size and encode throughput of every file, throughput being uncompressed bytes per second.
+    def __init__(self, profile="default", jobs=1):
+        if profile not in texture_profiles:
+            raise Exception(f"Invalid texture profile: {profile}")
+        self.profile = profile
+        self.options = texture_profiles[profile]
+        self.jobs = jobs
+        self.executor = ThreadPoolExecutor(max_workers=jobs) if jobs > 1 else None
+        self.futures = list()
+        self.results = list()
+
+    def submit(self, texture_file, image=None, data=None):
+        if self.executor is None:
+            self.results.append(self.encode(texture_file, image, data))
+        else:
+            self.futures.append(self.executor.submit(self.encode, texture_file, image, data))
+        return texture_file
+
+    def encode(self, texture_file, image=None, data=None):
+        start = time.perf_counter()
+        if data is not None:
+            with open(texture_file, "wb") as file:
+                file.write(data)
+            mode, input_bytes = "raw", len(data)
+        else:
+            image.save(texture_file, **self.options)
+            mode, input_bytes = self.profile, image.width * image.height * len(image.getbands())
+        elapsed = time.perf_counter() - start
+        written = os.path.getsize(texture_file)
+        if mode == "raw":
+            print(f"    {texture_file}: {written / 1e6:.2f} MB (raw copy)")
+        else:
+            rate = input_bytes / elapsed / 1e6 if elapsed > 0 else 0.0
+            print(f"    {texture_file}: {written / 1e6:.2f} MB ({mode}) in {elapsed:.3f}s ({rate:.1f} MB/s)")
+        return texture_file, mode, input_bytes, written, elapsed
+
+    def close(self):
+        # waits for every pending encode, the first failed one is raised
+        try:
+            for future in self.futures:
+                self.results.append(future.result())
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+            self.futures = list()
+        # raw copies are reported apart, their near-zero write time says nothing about encoding
+        encoded = [result for result in self.results if result[1] != "raw"]
+        copied = [result for result in self.results if result[1] == "raw"]
+        if len(encoded) > 0:
+            input_bytes = sum(result[2] for result in encoded)
+            written = sum(result[3] for result in encoded)
+            busy = sum(result[4] for result in encoded)
+            rate = input_bytes / busy / 1e6 if busy > 0 else 0.0
+            print(f"Encoded {len(encoded)} textures, {input_bytes / 1e6:.2f} MB -> {written / 1e6:.2f} MB "
+                  f"in {busy:.2f}s of encoding ({rate:.1f} MB/s, profile={self.profile}, encode_jobs={self.jobs})")
+        if len(copied) > 0:
+            print(f"Copied {len(copied)} unchanged source textures, {sum(result[3] for result in copied) / 1e6:.2f} MB")
+        return self.results
 
 class GLBObjectScene:
     def __init__(self, filename, name=None):
         self.filename = filename
         self.name = filename if name is None else name
-        self.objects = list()
         self.materials = list()
 
         glb = pygltflib.GLTF2().load(filename)
-        glb.convert_images(pygltflib.ImageFormat.DATAURI)       # for accessing the binary image data
-
-        binary_blob = glb.binary_blob()        # all binary data
+        binary_blob = glb.binary_blob()        # all binary data, images are sliced from it as well
         scene = glb.scenes[glb.scene]
 
         mesh_list = list()
@@ -53,234 +271,393 @@ class GLBObjectScene:
             root_mesh_list = parse_tree(glb.nodes, node_index)
             mesh_list.extend(root_mesh_list)
 
-        for i in range(len(mesh_list)):
-            mesh = glb.meshes[mesh_list[i][0]]
-            matrix = mesh_list[i][1]
-            primitive = mesh.primitives[0]
-            print(f"Mesh index: {i}")
-            print(f"    Attributes={primitive.attributes}")
-            print(f"    Indices={primitive.indices}, Material={primitive.material}")
-            # "primitive.attributes" records the indices in "accessors". It is like:
-            #      Attributes(POSITION=2, NORMAL=1, TANGENT=None, TEXCOORD_0=None, TEXCOORD_1=None,
-            #                 COLOR_0=None, JOINTS_0=None, WEIGHTS_0=None)
-
-            # parse vertices
-            points_accessor = glb.accessors[primitive.attributes.POSITION]
-            points_buffer_view = glb.bufferViews[points_accessor.bufferView]
-            points = np.frombuffer(
-                binary_blob[
-                    points_buffer_view.byteOffset + points_accessor.byteOffset:
-                    points_buffer_view.byteOffset + points_buffer_view.byteLength
-                ],
-                dtype=np.float32, count=points_accessor.count * 3,
-            ).reshape((-1, 3)).astype(float)
-            print(f"Points: {points.shape}")
-            
-            # parse faces
-            triangles_accessor = glb.accessors[primitive.indices]
-            triangles_buffer_view = glb.bufferViews[triangles_accessor.bufferView]
-            triangles_component_type = triangles_accessor.componentType
-            # triangles_buffer_range = triangles_buffer_view.byteLength - triangles_accessor.byteOffset
-            if triangles_component_type == pygltflib.UNSIGNED_BYTE:
-                triangles_t = np.uint8
-            elif triangles_component_type == pygltflib.UNSIGNED_INT:
-                triangles_t = np.uint32
-            else:
-                raise Exception(f"Invalid triangles uint alignment, component_type: {triangles_component_type}")
-            triangles = np.frombuffer(
-                binary_blob[
-                    triangles_buffer_view.byteOffset + triangles_accessor.byteOffset:
-                    triangles_buffer_view.byteOffset + triangles_buffer_view.byteLength
-                ],
-                dtype=triangles_t, count=triangles_accessor.count
-            ).reshape((-1, 3)).astype(np.int32)
-            print(f"Triangles: {triangles.shape}, "
-                  f"{triangles_buffer_view.byteLength - triangles_accessor.byteOffset}")
-
-            # parse normals
-            if primitive.attributes.NORMAL:
-                normals_accessor = glb.accessors[primitive.attributes.NORMAL]
-                normals_buffer_view = glb.bufferViews[normals_accessor.bufferView]
-                normals = np.frombuffer(
-                    binary_blob[
-                        normals_buffer_view.byteOffset + normals_accessor.byteOffset:
-                        normals_buffer_view.byteOffset + normals_buffer_view.byteLength
-                    ],
-                    dtype=np.float32, count=normals_accessor.count * 3,
-                ).reshape((-1, 3)).astype(float)
-                print(f"Normals: {normals.shape}, "
-                      f"{normals_buffer_view.byteLength - normals_accessor.byteOffset}")
-            else:
-                normals = trimesh.Trimesh(points, triangles).vertex_normals
-
-            # parse uvs
-            if primitive.attributes.TEXCOORD_0:
-                texcoords_accessor = glb.accessors[primitive.attributes.TEXCOORD_0]
-                texcoords_buffer_view = glb.bufferViews[texcoords_accessor.bufferView]
-                uvs = np.frombuffer(
-                    binary_blob[
-                        texcoords_buffer_view.byteOffset + texcoords_accessor.byteOffset:
-                        texcoords_buffer_view.byteOffset + texcoords_buffer_view.byteLength
-                    ],
-                    dtype=np.float32, count=texcoords_accessor.count * 2,
-                ).reshape((-1, 2)).astype(float)
-                uvs[:, 1] = 1.0 - uvs[:, 1]
-            else:
-                uvs = None
-                
-            # parse colors
-            if primitive.attributes.COLOR_0:
-                colors_accessor = glb.accessors[primitive.attributes.COLOR_0]
-                colors_buffer_view = glb.bufferViews[colors_accessor.bufferView]
-                if colors_accessor.type == "VEC3":
-                    colors_vec = 3
-                elif colors_accessor.type == "VEC4":
-                    colors_vec = 4
-                else:
-                    raise Exception(f"Invalid colors channels, type: {colors_accessor.type}")
-                if colors_accessor.componentType == pygltflib.UNSIGNED_BYTE:
-                    colors_t = np.uint8
-                elif colors_accessor.componentType == pygltflib.FLOAT:
-                    colors_t = np.float32
-                else:
-                    raise Exception(f"Invalid colors alignment, component_type: {colors_accessor.componentType}")
-                colors = np.frombuffer(
-                    binary_blob[
-                        colors_buffer_view.byteOffset + colors_accessor.byteOffset:
-                        colors_buffer_view.byteOffset + colors_buffer_view.byteLength
-                    ],
-                    dtype=colors_t, count=colors_accessor.count * colors_vec
-                ).reshape((-1, colors_vec))
-                if colors_t == np.float32:
-                    colors = np.round(colors * 255).astype(np.uint8)
-                print(f"Colors: {colors.shape}, "
-                      f"{colors_buffer_view.byteLength - colors_accessor.byteOffset}")
-            else:
-                colors = None
-            
-            material_index = primitive.material
-
-            # rebuild mesh and save to .obj file
-            points, normals = apply_transform(matrix, points, normals)
-            self.objects.append(GLBObject(
-                vertices=points,
-                faces=triangles,
-                vertex_normals=normals,
-                vertex_colors=colors,
-                uvs=uvs,
-                material=material_index
-            ))
+        # every glTF mesh is decoded once, however many nodes instance it
+        self.instances = mesh_list
+        self.meshes = dict()
+        for mesh_index, matrix in mesh_list:
+            if mesh_index not in self.meshes:
+                self.meshes[mesh_index] = decode_mesh(glb, binary_blob, mesh_index)
+        self.transformed_objects = None
+        self.objects_lock = threading.Lock()
 
-        for i in range(len(glb.materials)):
-            # parse images
-            color_image, metallic_image, roughness_image = None, None, None
-            material = glb.materials[i]
+        images = dict()
+        base_dir = os.path.split(filename)[0]
 
-            # Check if material has a base color texture
-            if material.pbrMetallicRoughness.baseColorTexture is not None:
-                texture = glb.textures[material.pbrMetallicRoughness.baseColorTexture.index]
-                image_index = texture.source
-                color_image = uri_to_image(glb.images[image_index].uri)
-                # image_data = Image.open(image_data).convert("RGBA")
-
-            # parse colors
-            if material.pbrMetallicRoughness.baseColorFactor is not None:
-                colors_factor = material.pbrMetallicRoughness.baseColorFactor
-                colors_factor = np.array(colors_factor, dtype=np.float32)
-                if color_image is None:
-                    color_image = Image.new("RGBA", (1, 1), (255, 255, 255, 255))
-                # colors_factor
-                bands = color_image.split()
-                color_image = Image.merge("RGBA", [
-                    Image.eval(bands[i], lambda x: x * colors_factor[i]) for i in range(4)
-                ])
-
-            if material.pbrMetallicRoughness.metallicRoughnessTexture is not None:
-                texture = glb.textures[material.pbrMetallicRoughness.metallicRoughnessTexture.index]
-                image_index = texture.source
-                image = uri_to_image(glb.images[image_index].uri)
-                bands = image.split()
-                if len(bands) == 1:
-                    roughness_image = bands[0]
-                else:
-                    metallic_image, roughness_image = bands[1], bands[2]    # G for metallic, B for roughness
-
-            if material.pbrMetallicRoughness.metallicFactor is not None:
-                metallic_factor = material.pbrMetallicRoughness.metallicFactor
-                if metallic_image is None:
-                    metallic_image = Image.new("L", (1, 1), 255)
-                metallic_image = Image.eval(metallic_image, lambda x: x * metallic_factor)
-
-            if material.pbrMetallicRoughness.roughnessFactor is not None:
-                roughness_factor = material.pbrMetallicRoughness.roughnessFactor
-                if roughness_image is None:
-                    roughness_image = Image.new("L", (1, 1), 255)
-                roughness_image = Image.eval(roughness_image, lambda x: x * roughness_factor)
+        def texture_image(texture_info):
+            if texture_info is None:
+                return None
+            image_index = glb.textures[texture_info.index].source
+            if image_index not in images:
+                image = glb.images[image_index]
+                images[image_index] = GLBImage(read_image_bytes(glb, binary_blob, image, base_dir), image.mimeType)
+            return images[image_index]
 
+        for i in range(len(glb.materials)):
+            material = glb.materials[i]
+            pbr = material.pbrMetallicRoughness
+            if pbr is None:
+                pbr = pygltflib.PbrMetallicRoughness()
             self.materials.append(GLBMaterial(
-                image_texture=color_image,
-                metallic_texture=metallic_image,
-                roughness_texture=roughness_image
+                color_source=texture_image(pbr.baseColorTexture),
+                color_factor=pbr.baseColorFactor,
+                metallic_roughness_source=texture_image(pbr.metallicRoughnessTexture),
+                metallic_factor=pbr.metallicFactor,
+                roughness_factor=pbr.roughnessFactor,
+                occlusion_source=texture_image(material.occlusionTexture),
+                occlusion_strength=None if material.occlusionTexture is None else material.occlusionTexture.strength,
             ))
 
+    @property
+    def objects(self):
+        # one transformed object per node instance, all instances of a mesh in one batched pass;
+        # the export threads all ask for it at once, only the first one transforms
+        with self.objects_lock:
+            if self.transformed_objects is None:
+                objects = [None] * len(self.instances)
+                groups = dict()
+                for i, (mesh_index, _) in enumerate(self.instances):
+                    groups.setdefault(mesh_index, list()).append(i)
+                for mesh_index, indices in groups.items():
+                    mesh = self.meshes[mesh_index]
+                    matrices = np.stack([self.instances[i][1] for i in indices])
+                    points, normals = transform_instances(matrices, mesh.vertices, mesh.vertex_normals)
+                    for k, i in enumerate(indices):
+                        objects[i] = GLBObject(
+                            vertices=points[k],
+                            faces=mesh.faces,
+                            vertex_normals=None if normals is None else normals[k],
+                            vertex_colors=mesh.vertex_colors,
+                            uvs=mesh.uvs,
+                            material=mesh.material
+                        )
+                self.transformed_objects = objects
+            return self.transformed_objects
+
     def obj_count(self):
         return len(self.objects)
 
     def get_object(self, index=0):
         return self.objects[index]
     
-    def export_all(self):
+    def export_all(self, jobs=1, constant_images=False, instances=False, orm=False,
+                   texture_profile="default", encode_jobs=1):
         export_dir = os.path.join(os.path.split(self.filename)[0], self.name)
         model_dir = os.path.join(export_dir, "models")
         texture_dir = os.path.join(export_dir, "textures")
         os.makedirs(model_dir, exist_ok=True)
         os.makedirs(texture_dir, exist_ok=True)
-        for i in range(len(self.objects)):
-            self.export_object(model_dir, i)
-        for i in range(len(self.materials)):
-            self.export_texture(texture_dir, i)
+        if instances:
+            # each unique mesh once, untransformed, plus the node transforms in instances.json
+            tasks = [(self.export_mesh, model_dir, mesh_index) for mesh_index in self.meshes]
+        else:
+            tasks = [(self.export_object, model_dir, i) for i in range(len(self.instances))]
+        # textures are decoded and baked by the tasks, and PNG encoded on the encoder's own threads
+        encoder = TextureEncoder(texture_profile, encode_jobs)
+        tasks += [
+            (self.export_texture, texture_dir, i, constant_images, orm, encoder) for i in range(len(self.materials))
+        ]
+
+        outputs = list()
+        try:
+            if jobs <= 1:
+                for task in tasks:
+                    outputs.extend(task[0](*task[1:]))
+            else:
+                # trimesh formatting holds the GIL, but PIL encoding and file writes release it
+                with ThreadPoolExecutor(max_workers=jobs) as executor:
+                    futures = [executor.submit(*task) for task in tasks]
+                    for future in futures:
+                        outputs.extend(future.result())
+        finally:
+            encoder.close()
+        if instances:
+            outputs.append(self.export_instances(model_dir))
+        else:
+            outputs.append(self.export_object_materials(model_dir))
+        outputs.append(self.export_materials(texture_dir, constant_images, orm))
+        return outputs
 
     def export_object(self, dir_name, index=0):
         # object_dir = self.filename + '.objects'
-        obj = self.objects[index]
         obj_file = os.path.join(dir_name, f"object_{index}.obj")
         print(f"Export mesh index {index} to: {obj_file}")
-        mesh = trimesh.Trimesh(
-            vertices=obj.vertices,
-            faces=obj.faces,
-            vertex_normals=obj.vertex_normals,
-            vertex_colors=obj.vertex_colors
-        )
-        mesh.visual = trimesh.visual.texture.TextureVisuals(uv=obj.uvs)
-        export_without_mtl(mesh, obj_file)
+        return export_glb_object(self.objects[index], obj_file)
+
+    def export_mesh(self, dir_name, mesh_index=0):
+        obj_file = os.path.join(dir_name, f"mesh_{mesh_index}.obj")
+        print(f"Export unique mesh {mesh_index} to: {obj_file}")
+        return export_glb_object(self.meshes[mesh_index], obj_file)
 
-    def export_texture(self, dir_name, index=0):
+    def export_object_materials(self, dir_name):
+        # which material each object_<index>.obj uses, for asset_index
+        objects = [{
+            "mesh": f"object_{i}.obj",
+            "material": self.meshes[mesh_index].material,
+        } for i, (mesh_index, _) in enumerate(self.instances)]
+        objects_file = os.path.join(dir_name, "objects.json")
+        with open(objects_file, "w") as file:
+            json.dump(objects, file, indent=4)
+        return objects_file
+
+    def export_instances(self, dir_name):
+        instances = [{
+            "mesh": f"mesh_{mesh_index}.obj",
+            "material": self.meshes[mesh_index].material,
+            # row-vector convention: [x, y, z, 1] @ matrix
+            "matrix": np.asarray(matrix, dtype=float).tolist(),
+        } for mesh_index, matrix in self.instances]
+        instances_file = os.path.join(dir_name, "instances.json")
+        with open(instances_file, "w") as file:
+            json.dump(instances, file, indent=4)
+        return instances_file
+
+    def export_texture(self, dir_name, index=0, constant_images=False, orm=False, encoder=None):
         mat = self.materials[index]
+        texture_files = list()
 
-        if mat.image_texture is not None:
-            color_image_file = os.path.join(dir_name, f'color_{index}.png')
-            print(f"Export texture index {index} to: {color_image_file}")
-            mat.image_texture.save(color_image_file)
-    
-        if mat.metallic_texture is not None:
-            metallic_image_file = os.path.join(dir_name, f'matallic_{index}.png')
-            print(f"Export texture index {index} to: {metallic_image_file}")
-            mat.metallic_texture.save(metallic_image_file)
-    
-        if mat.roughness_texture is not None:
-            roughness_image_file = os.path.join(dir_name, f'roughness_{index}.png')
-            print(f"Export texture index {index} to: {roughness_image_file}")
-            mat.roughness_texture.save(roughness_image_file)
-
-def uri_to_image(uri):
-    image_data = base64.b64decode(uri.split(",")[1])
-    return Image.open(BytesIO(image_data)).convert("RGBA")
-
-def apply_transform(matrix, positions, normals=None):
-    n = positions.shape[0]
-    transformed_positions = (np.hstack([positions, np.ones((n, 1))]) @ matrix)[:, :3]
+        color_data = mat.color_passthrough()
+        color_image = mat.image_texture if color_data is None else None
+        if orm:
+            # one packed file instead of matallic_<index>.png and roughness_<index>.png
+            metallic_image, roughness_image = None, None
+            orm_data = mat.orm_passthrough()
+            orm_image = mat.orm_texture() if orm_data is None else None
+        else:
+            metallic_image, roughness_image = mat.metallic_roughness_textures()
+            orm_data, orm_image = None, None
+        if constant_images:
+            # 1x1 stand-ins for consumers that can only read texture files
+            if color_image is None and color_data is None:
+                color_image = Image.fromarray(constant_pixels(mat.color_constant).reshape((1, 1, 4)), "RGBA")
+            if orm:
+                if orm_image is None and orm_data is None:
+                    orm_image = Image.fromarray(constant_pixels(
+                        [1.0, mat.roughness_constant, mat.metallic_constant]
+                    ).reshape((1, 1, 3)), "RGB")
+            else:
+                if metallic_image is None:
+                    metallic_image = Image.fromarray(constant_pixels([mat.metallic_constant]).reshape((1, 1)), "L")
+                if roughness_image is None:
+                    roughness_image = Image.fromarray(constant_pixels([mat.roughness_constant]).reshape((1, 1)), "L")
+
+        # encoded by the scene's encoder, a serial one when exporting a single material
+        encoder = TextureEncoder() if encoder is None else encoder
+        textures = [
+            ("color", color_image, color_data),
+            ("matallic", metallic_image, None),
+            ("roughness", roughness_image, None),
+            ("orm", orm_image, orm_data),
+        ]
+        for prefix, image, data in textures:
+            if image is None and data is None:
+                continue
+            texture_file = os.path.join(dir_name, f'{prefix}_{index}.png')
+            print(f"Export texture index {index} to: {texture_file}")
+            texture_files.append(encoder.submit(texture_file, image, data))
+
+        return texture_files
+
+    def export_materials(self, dir_name, constant_images=False, orm=False):
+        # every channel is either a texture file name or its constant value
+        def channel(constant, file_name):
+            if constant is None or constant_images:
+                return file_name
+            return constant
+
+        descriptions = list()
+        for i, mat in enumerate(self.materials):
+            if not orm:
+                descriptions.append({
+                    "color": channel(mat.color_constant, f"color_{i}.png"),
+                    "metallic": channel(mat.metallic_constant, f"matallic_{i}.png"),
+                    "roughness": channel(mat.roughness_constant, f"roughness_{i}.png"),
+                })
+            elif mat.has_orm or constant_images:
+                # metallic and roughness are read from the channels of orm_<index>.png
+                descriptions.append({
+                    "color": channel(mat.color_constant, f"color_{i}.png"),
+                    "orm": f"orm_{i}.png",
+                    "orm_channels": mat.orm_channels(),
+                })
+            else:
+                descriptions.append({
+                    "color": channel(mat.color_constant, f"color_{i}.png"),
+                    "metallic": mat.metallic_constant,
+                    "roughness": mat.roughness_constant,
+                })
+        materials_file = os.path.join(dir_name, "materials.json")
+        with open(materials_file, "w") as file:
+            json.dump(descriptions, file, indent=4)
+        return materials_file
+
+def export_glb_object(obj, obj_file):
+    write_obj(
+        obj_file,
+        vertices=obj.vertices,
+        faces=obj.faces,
+        vertex_normals=obj.vertex_normals,
+        uvs=obj.uvs,
+        # vertex colors were never part of the exported files, keep them out for LuisaRender
+    )
+    cache_file = write_mesh_cache(
+        mesh_cache_path(obj_file), obj.vertices, obj.faces, obj.vertex_normals, obj.uvs, source=obj_file
+    )
+    return obj_file, cache_file
+
+def is_identity(factor):
+    return factor is None or all(f == 1.0 for f in factor)
+
+def bake_factors(pixels, factors):
+    # uint8 (..., C) pixels times C factors, rounded half to even like PIL's Image.eval
+    baked = np.multiply(pixels, np.asarray(factors, dtype=np.float32), dtype=np.float32)
+    np.rint(baked, out=baked)
+    np.clip(baked, 0, 255, out=baked)
+    return baked.astype(np.uint8)
+
+def constant_pixels(constant):
+    return bake_factors(np.full(len(constant), 255, dtype=np.uint8), constant)
+
+accessor_dtypes = {
+    pygltflib.BYTE: np.dtype("<i1"),
+    pygltflib.UNSIGNED_BYTE: np.dtype("<u1"),
+    pygltflib.SHORT: np.dtype("<i2"),
+    pygltflib.UNSIGNED_SHORT: np.dtype("<u2"),
+    pygltflib.UNSIGNED_INT: np.dtype("<u4"),
+    pygltflib.FLOAT: np.dtype("<f4"),
+}
+
+accessor_sizes = {
+    "SCALAR": 1,
+    "VEC2": 2,
+    "VEC3": 3,
+    "VEC4": 4,
+}
+
+def read_accessor(glb, binary_blob, accessor_index, normalize=False):
+    # Returns a (count,) or (count, n) array in the accessor's native component type. The array
+    # is a read-only view into binary_blob, strided for interleaved buffer views, unless
+    # "normalize" asks for normalized integers to be converted to float32.
+    accessor = glb.accessors[accessor_index]
+    if accessor.sparse is not None:
+        raise Exception(f"Sparse accessors are not supported, accessor: {accessor_index}")
+    if accessor.componentType not in accessor_dtypes:
+        raise Exception(f"Invalid accessor component_type: {accessor.componentType}")
+    if accessor.type not in accessor_sizes:
+        raise Exception(f"Invalid accessor type: {accessor.type}")
+    dtype = accessor_dtypes[accessor.componentType]
+    size = accessor_sizes[accessor.type]
+    shape = (accessor.count,) if size == 1 else (accessor.count, size)
+
+    if accessor.bufferView is None:
+        data = np.zeros(shape, dtype=dtype)
+    else:
+        buffer_view = glb.bufferViews[accessor.bufferView]
+        offset = (buffer_view.byteOffset or 0) + (accessor.byteOffset or 0)
+        stride = buffer_view.byteStride or dtype.itemsize * size
+        last = offset + stride * (accessor.count - 1) + dtype.itemsize * size
+        if accessor.count > 0 and last > len(binary_blob):
+            raise Exception(f"Accessor {accessor_index} exceeds the binary buffer")
+        strides = (stride,) if size == 1 else (stride, dtype.itemsize)
+        data = np.ndarray(shape, dtype=dtype, buffer=binary_blob, offset=offset, strides=strides)
+
+    if normalize and accessor.normalized and dtype.kind != "f":
+        # signed values are clamped to -1, see the glTF 2.0 spec on normalized accessors
+        data = data.astype(np.float32) / np.float32(np.iinfo(dtype).max)
+        if dtype.kind == "i":
+            np.maximum(data, -1.0, out=data)
+    return data
+
+def sniff_mime_type(data):
+    header = bytes(data[:8])
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    return None
+
+def read_image_bytes(glb, binary_blob, image, base_dir):
+    if image.bufferView is not None:
+        buffer_view = glb.bufferViews[image.bufferView]
+        offset = buffer_view.byteOffset or 0
+        return memoryview(binary_blob)[offset: offset + buffer_view.byteLength]
+    if image.uri is None:
+        raise Exception("Image has neither a bufferView nor an uri")
+    if image.uri.startswith("data:"):
+        return base64.b64decode(image.uri.split(",")[1])
+    with open(os.path.join(base_dir, image.uri), "rb") as file:
+        return file.read()
+
+def decode_mesh(glb, binary_blob, mesh_index):
+    mesh = glb.meshes[mesh_index]
+    primitive = mesh.primitives[0]
+    print(f"Mesh index: {mesh_index}")
+    print(f"    Attributes={primitive.attributes}")
+    print(f"    Indices={primitive.indices}, Material={primitive.material}")
+    # "primitive.attributes" records the indices in "accessors". It is like:
+    #      Attributes(POSITION=2, NORMAL=1, TANGENT=None, TEXCOORD_0=None, TEXCOORD_1=None,
+    #                 COLOR_0=None, JOINTS_0=None, WEIGHTS_0=None)
+
+    # parse vertices
+    points = read_accessor(glb, binary_blob, primitive.attributes.POSITION)
+    print(f"Points: {points.shape}, {points.dtype}")
+
+    # parse faces
+    if primitive.indices is not None:
+        triangles = read_accessor(glb, binary_blob, primitive.indices)
+        if triangles.dtype.kind != "u":
+            raise Exception(f"Invalid triangles index type: {triangles.dtype}")
+        triangles = triangles.reshape((-1, 3))
+    else:
+        triangles = np.arange(points.shape[0], dtype=np.uint32).reshape((-1, 3))
+    print(f"Triangles: {triangles.shape}, {triangles.dtype}")
+
+    # parse normals
+    if primitive.attributes.NORMAL is not None:
+        normals = read_accessor(glb, binary_blob, primitive.attributes.NORMAL, normalize=True)
+        print(f"Normals: {normals.shape}, {normals.dtype}")
+    else:
+        normals = trimesh.Trimesh(points, triangles, process=False).vertex_normals.astype(np.float32)
+
+    # parse uvs
+    if primitive.attributes.TEXCOORD_0 is not None:
+        uvs = read_accessor(glb, binary_blob, primitive.attributes.TEXCOORD_0, normalize=True)
+        uvs = uvs.astype(np.float32)        # the only copy, the v flip cannot be done on a view
+        uvs[:, 1] = 1.0 - uvs[:, 1]
+    else:
+        uvs = None
+
+    # parse colors
+    if primitive.attributes.COLOR_0 is not None:
+        colors = read_accessor(glb, binary_blob, primitive.attributes.COLOR_0)
+        if colors.ndim != 2 or colors.shape[1] not in (3, 4):
+            raise Exception(f"Invalid colors channels, shape: {colors.shape}")
+        if colors.dtype == np.uint16:
+            colors = np.round(colors / 257).astype(np.uint8)
+        elif colors.dtype != np.uint8:
+            colors = np.round(colors * 255).astype(np.uint8)
+        print(f"Colors: {colors.shape}")
+    else:
+        colors = None
+
+    return GLBObject(
+        vertices=points,
+        faces=triangles,
+        vertex_normals=normals,
+        vertex_colors=colors,
+        uvs=uvs,
+        material=primitive.material
+    )
+
+def transform_instances(matrices, positions, normals=None):
+    # Row-vector convention of parse_tree: p' = p @ M[:3, :3] + M[3, :3]. All k matrices are
+    # applied in one batched matmul into a (k, n, 3) buffer, the translation is added in place.
+    dtype = positions.dtype if positions.dtype.kind == "f" else np.float32
+    matrices = np.asarray(matrices, dtype=dtype)
+    linear = matrices[:, :3, :3]
+    transformed_positions = np.matmul(positions.astype(dtype, copy=False)[None], linear)
+    transformed_positions += matrices[:, None, 3, :3]
     if normals is not None:
-        transformed_normals = (np.hstack([normals, np.zeros((n, 1))]) @ matrix)[:, :3]
+        transformed_normals = np.matmul(normals.astype(dtype, copy=False)[None], linear)
     else:
         transformed_normals = None
     return transformed_positions, transformed_normals
@@ -316,23 +693,107 @@ def parse_tree(nodes, node_index):
         mesh_list[i][1] = mesh_list[i][1] @ matrix
     return mesh_list
 
+def find_glb_files(root):
+    file_paths = list()
+    for dir_path, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(".glb"):
+                file_paths.append(os.path.join(dir_path, filename))
+    return sorted(file_paths)
+
+def convert_glb(file_path, name=None, jobs=1, constant_images=False, instances=False, orm=False,
+                texture_profile="default", encode_jobs=1):
+    if name is None:
+        name = os.path.splitext(os.path.split(file_path)[1])[0]
+    scene = GLBObjectScene(file_path, name)
+    return scene.export_all(
+        jobs=jobs, constant_images=constant_images, instances=instances, orm=orm,
+        texture_profile=texture_profile, encode_jobs=encode_jobs
+    )
+
+def batch_convert(file_paths, jobs=1, scene_jobs=1, manifest=None, constant_images=False, instances=False, orm=False,
+                  texture_profile="default", encode_jobs=1):
+    # per-file failures are collected so that one broken GLB does not abort the whole library
+    start = time.perf_counter()
+    if manifest is not None:
+        pending = [file_path for file_path in file_paths if not manifest.is_current(file_path)]
+    else:
+        pending = list(file_paths)
+    failures = list()
+
+    def on_done(file_path, outputs):
+        if manifest is not None:
+            manifest.record(file_path, outputs)
+
+    if jobs <= 1:
+        for file_path in pending:
+            try:
+                on_done(file_path, convert_glb(
+                    file_path, jobs=scene_jobs, constant_images=constant_images, instances=instances, orm=orm,
+                    texture_profile=texture_profile, encode_jobs=encode_jobs
+                ))
+            except Exception as e:
+                failures.append((file_path, repr(e)))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(
+                    convert_glb, file_path, None, scene_jobs, constant_images, instances, orm,
+                    texture_profile, encode_jobs
+                ): file_path
+                for file_path in pending
+            }
+            for future in as_completed(futures):
+                try:
+                    on_done(futures[future], future.result())
+                except Exception as e:
+                    failures.append((futures[future], repr(e)))
+    if manifest is not None:
+        for file_path, error in failures:
+            manifest.forget(file_path)
+        manifest.save()
+    elapsed = time.perf_counter() - start
+
+    converted = len(pending) - len(failures)
+    skipped = len(file_paths) - len(pending)
+    rate = len(pending) / elapsed if elapsed > 0 else 0.0
+    print(f"Converted {converted}/{len(pending)} GLB files ({skipped} unchanged) in {elapsed:.2f}s "
+          f"({rate:.2f} files/s, jobs={jobs})")
+    for file_path, error in sorted(failures):
+        print(f"    FAILED {file_path}: {error}")
+    return failures
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--check_all_models", action="store_true", default=False)
     parser.add_argument("--path", type=str, default=None)
     parser.add_argument("--name", type=str, default=None)
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--scene_jobs", type=int, default=1)
+    parser.add_argument("--force", action="store_true", default=False)
+    parser.add_argument("--constant_images", action="store_true", default=False)
+    parser.add_argument("--instances", action="store_true", default=False)
+    parser.add_argument("--orm", action="store_true", default=False)
+    parser.add_argument("--texture_profile", type=str, default="default", choices=sorted(texture_profiles))
+    parser.add_argument("--encode_jobs", type=int, default=1)
     args = parser.parse_args()
 
     # test_file = "./assets/models/glb/eraser.glb"
     if args.check_all_models:
-        walks = os.walk("./assets/models/glb/")
-        for dir_path, dirnames, filenames in walks:
-            for filename in filenames:
-                if filename.endswith(".glb"):
-                    file_path = os.path.join(dir_path, filename)
-                    name = os.path.splitext(filename)[0]
-                    scene = GLBObjectScene(file_path, name)
-                    scene.export_all()
+        file_paths = find_glb_files("./assets/models/glb/")
+        export_mode = "".join(f"-{flag}" for flag in ("constant_images", "instances", "orm") if getattr(args, flag))
+        if args.texture_profile != "default":
+            export_mode += f"-{args.texture_profile}"
+        manifest = AssetManifest("glb", f"{glb_tool_version}{export_mode}")
+        if args.force:
+            manifest.entries.clear()
+        failures = batch_convert(
+            file_paths, jobs=args.jobs, scene_jobs=args.scene_jobs,
+            manifest=manifest, constant_images=args.constant_images, instances=args.instances, orm=args.orm,
+            texture_profile=args.texture_profile, encode_jobs=args.encode_jobs
+        )
+        if len(failures) > 0:
+            raise SystemExit(1)
     else:
         file_path = args.path
         if args.name is None:
@@ -341,4 +802,7 @@ if __name__ == "__main__":
         else:
             name = args.name
         scene = GLBObjectScene(file_path, name)
-        scene.export_all()
\ No newline at end of file
+        scene.export_all(
+            jobs=args.jobs, constant_images=args.constant_images, instances=args.instances, orm=args.orm,
+            texture_profile=args.texture_profile, encode_jobs=args.encode_jobs
+        )
\ No newline at end of file
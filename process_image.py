@@ -1,7 +1,11 @@
 import os
+import struct
 import numpy as np
+from io import BytesIO
 from PIL import Image
-from typing import List
+from typing import Iterable, Iterator
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 def get_png_filename(exr_file):
     print(f"Converting file: {exr_file} {os.path.exists(exr_file)}")
@@ -13,79 +17,208 @@ def get_png_filename(exr_file):
     return png_file
 
 
+# The three converters below used to go through imageio (FreeImage), OpenCV and OpenEXR. They now
+# share tonemap.py and keep their original curves: linear scaled by the maximum, gamma 2.2 over the
+# min-max range (cv2.createTonemap) and gamma 2.2 at +0.5 EV.
 def exr_to_png_imageio(exr_file):
-    import imageio
+    from tonemap import tonemap_file
 
-    png_file = get_png_filename(exr_file)
-
-    imageio.plugins.freeimage.download()
-    image = imageio.imread(exr_file, format='EXR-FI')
-    image = image[:, :, :3]  # remove alpha channel for jpg conversion
-    data = image.astype(image.dtype) / image.max()  # normalize the data to 0 - 1
-    data = 255 * data  # Now scale by 255
-    rgb_image = data.astype('uint8')
-    imageio.imwrite(png_file, rgb_image, format='png')
-    return png_file
+    return tonemap_file(exr_file, get_png_filename(exr_file), operator="gamma", gamma=1.0, normalize="max")
 
 
 def exr_to_png_cv(exr_file):
-    import cv2
+    from tonemap import tonemap_file
 
-    png_file = get_png_filename(exr_file)
-
-    exr_image = cv2.imread(exr_file, cv2.IMREAD_ANYCOLOR | cv2.IMREAD_ANYDEPTH)
-    tonemap = cv2.createTonemap(gamma=2.2)
-    ldr_image = tonemap.process(exr_image)
-    ldr_image = np.clip(ldr_image * 255, 0, 255).astype('uint8')
-    cv2.imwrite(png_file, ldr_image)
-    return png_file
+    return tonemap_file(exr_file, get_png_filename(exr_file), operator="gamma", gamma=2.2, normalize="range")
 
 
 def exr_to_png_openexr(exr_file):
+    from tonemap import tonemap_file
+
+    return tonemap_file(exr_file, get_png_filename(exr_file), operator="gamma", exposure=0.5, gamma=2.2)
+
+def read_exr(exr_file, channels=None) -> np.ndarray:
     import OpenEXR
     import Imath
-    from PIL import Image
-
-    png_file = get_png_filename(exr_file)
 
     exr_img = OpenEXR.InputFile(exr_file)
     header = exr_img.header()
     dw = header['dataWindow']
     size = (dw.max.x - dw.min.x + 1, dw.max.y - dw.min.y + 1)
+    if channels is None:
+        names = list(header['channels'].keys())
+        channels = [c for c in "RGBA" if c in names] or sorted(names)
 
     pt = Imath.PixelType(Imath.PixelType.FLOAT)
-    channels = ['R', 'G', 'B']
-    rgb = [np.frombuffer(exr_img.channel(c, pt), dtype=np.float32) for c in channels]
-    rgb = [c.reshape(size[1], size[0]) for c in rgb]
-
-    exposure = 0.5
-    tonemapped_rgb = [np.clip(np.power(c * np.power(2, exposure), 1 / 2.2), 0, 1) for c in rgb]
-    tonemapped_image = np.dstack(tonemapped_rgb)
-    tonemapped_image = np.uint8(tonemapped_image * 255)
-
-    Image.fromarray(tonemapped_image).save(png_file)
-    return png_file
+    image = np.empty((size[1], size[0], len(channels)), dtype=np.float32)
+    for i, c in enumerate(channels):
+        image[:, :, i] = np.frombuffer(exr_img.channel(c, pt), dtype=np.float32).reshape(size[1], size[0])
+    exr_img.close()
+    return image
+
+def write_exr(exr_file, image, channels, pixel_types=None, compression=None):
+    # image is HxWxC, channels names its last axis; pixel_types maps a channel to "HALF" or "FLOAT"
+    import OpenEXR
+    import Imath
 
-def read_png(png_file) -> Image.Image:
+    height, width = image.shape[:2]
+    header = OpenEXR.Header(width, height)
+    if compression is not None:
+        header['compression'] = Imath.Compression(compression)
+    pixel_types = dict() if pixel_types is None else pixel_types
+    header['channels'] = dict()
+    pixels = dict()
+    for i, c in enumerate(channels):
+        pixel_type = pixel_types.get(c, "FLOAT")
+        dtype = np.float16 if pixel_type == "HALF" else np.float32
+        header['channels'][c] = Imath.Channel(Imath.PixelType(getattr(Imath.PixelType, pixel_type)))
+        pixels[c] = np.ascontiguousarray(image[:, :, i], dtype=dtype).tobytes()
+    output_file = OpenEXR.OutputFile(exr_file, header)
+    output_file.writePixels(pixels)
+    output_file.close()
+    return exr_file
+
+def read_image(image_file) -> np.ndarray:
+    # float32 for EXR/HDR, the stored 8/16-bit layout for everything PIL reads
+    extension = os.path.splitext(image_file)[1].lower()
+    if extension == ".exr":
+        return read_exr(image_file)
+    if extension == ".hdr":
+        import cv2
+
+        image = cv2.imread(image_file, cv2.IMREAD_ANYCOLOR | cv2.IMREAD_ANYDEPTH)
+        return np.ascontiguousarray(image[:, :, ::-1])
+    with Image.open(image_file) as image:
+        return np.asarray(image)
+
+def read_png(png_file, scale=1.0) -> Image.Image:
+    # scale < 1 is applied while decoding: JPEG decodes at a reduced size, everything else is box
+    # reduced by the integer part of the factor before the final resample
     frame = Image.open(png_file)
-    return frame.copy()
-
-def write_gif(imgs: List[Image.Image], gif_file, fps=60):
-    duration = int(1000 / fps)
-    imgs[0].save(
-        gif_file, format='GIF', append_images=imgs[1:],
-        save_all=True, duration=duration, loop=0
-    )
+    if scale == 1.0:
+        return frame.copy()
+    size = (max(1, round(frame.width * scale)), max(1, round(frame.height * scale)))
+    frame.draft(frame.mode, size)
+    return frame.resize(size, Image.BILINEAR, reducing_gap=2.0)
+
+def load_frames(png_files: Iterable[str], scale=1.0, jobs=4, read_ahead=8) -> Iterator[Image.Image]:
+    # Decodes frames on a thread pool (PIL releases the GIL while decoding) and yields them in
+    # order; at most read_ahead frames are decoded or waiting at any time.
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        pending = deque()
+        for png_file in png_files:
+            # frames already read go out before the next input is taken, a full queue waits for the head
+            while len(pending) > 0 and (pending[0].done() or len(pending) >= max(read_ahead, 1)):
+                yield pending.popleft().result()
+            pending.append(executor.submit(read_png, png_file, scale))
+        while len(pending) > 0:
+            yield pending.popleft().result()
+
+def as_rgb_frame(img) -> Image.Image:
+    if isinstance(img, np.ndarray):
+        img = Image.fromarray(img)
+    return img if img.mode == "RGB" else img.convert("RGB")
+
+def gif_frame_blocks(frame: Image.Image, delay):
+    # Encodes one palette frame with PIL and returns its graphic control extension, image
+    # descriptor with the palette as local color table, and LZW data, ready to be appended.
+    buffer = BytesIO()
+    frame.save(buffer, format='GIF', optimize=False)
+    data = buffer.getvalue()
+    packed = data[10]
+    offset = 13
+    color_table = b""
+    if packed & 0x80:
+        color_table = data[offset: offset + 3 * (2 << (packed & 7))]
+        offset += len(color_table)
+    # disposal 1 (keep), no transparency
+    blocks = [b"\x21\xf9\x04\x04" + struct.pack("<H", delay) + b"\x00\x00"]
+    while data[offset] != 0x3B:
+        if data[offset] == 0x21:
+            # extensions PIL adds to a single frame are dropped, the GCE above replaces them
+            offset += 2
+            while data[offset] != 0:
+                offset += data[offset] + 1
+            offset += 1
+        elif data[offset] == 0x2C:
+            descriptor = bytearray(data[offset: offset + 10])
+            offset += 10
+            if not descriptor[9] & 0x80 and len(color_table) > 0:
+                descriptor[9] |= 0x80 | (packed & 7)
+                blocks.append(bytes(descriptor) + color_table)
+            else:
+                blocks.append(bytes(descriptor))
+            start = offset
+            offset += 1         # LZW minimum code size
+            while data[offset] != 0:
+                offset += data[offset] + 1
+            offset += 1
+            blocks.append(data[start: offset])
+        else:
+            raise Exception(f"Unexpected GIF block {data[offset]:#x}")
+    return b"".join(blocks)
+
+def palette_error(frame: Image.Image, quantized: Image.Image, step=4):
+    # mean absolute error per channel of the mapped frame, on every step-th row and column
+    palette = np.frombuffer(bytes(quantized.getpalette()[:768]), dtype=np.uint8).reshape(-1, 3)
+    indices = np.asarray(quantized)[::step, ::step]
+    reference = np.asarray(frame)[::step, ::step]
+    return float(np.abs(palette[indices].astype(np.int16) - reference).mean())
+
+def write_gif(imgs: Iterable[Image.Image], gif_file, fps=60, palette_tolerance=3.0):
+    # Frames are quantized and appended one at a time, so only the current frame is in memory.
+    # The 256 color palette of the last quantized frame is reused as long as mapping a frame onto
+    # it costs less than palette_tolerance levels of mean error, which is much cheaper than
+    # computing a new palette for every frame.
+    delay = int(1000 / fps) // 10
+    palette = None
+    count = 0
+    with open(gif_file, "wb") as file:
+        for img in imgs:
+            frame = as_rgb_frame(img)
+            if count == 0:
+                # logical screen of the first frame, no global color table, loop forever
+                file.write(b"GIF89a" + struct.pack("<HHBBB", frame.width, frame.height, 0x70, 0, 0))
+                file.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00")
+            quantized = None
+            if palette is not None:
+                quantized = frame.quantize(palette=palette, dither=Image.Dither.NONE)
+                if palette_error(frame, quantized) > palette_tolerance:
+                    quantized = None
+            if quantized is None:
+                quantized = frame.quantize(colors=256, method=Image.Quantize.MEDIANCUT)
+                palette = quantized
+            file.write(gif_frame_blocks(quantized, delay))
+            count += 1
+        if count == 0:
+            raise Exception("No frames to write")
+        file.write(b"\x3b")
     print(f'GIF saved to {gif_file}.')
 
-def write_mp4(imgs: List[Image.Image], mp4_file, fps=60, scale=1.0):
-    #  bitrate='50000k', 
-    from moviepy.editor import ImageSequenceClip
-
-    imgs_arr = [np.array(img) for img in imgs]
-    imgs_clip = ImageSequenceClip(imgs_arr, fps=fps)
-    imgs_clip.resize(scale)
-    imgs_clip.write_videofile(mp4_file, fps=fps, logger=None)
+def write_mp4(imgs: Iterable[Image.Image], mp4_file, fps=60, scale=1.0):
+    # Frames are piped to ffmpeg (libx264, yuv420p, ffmpeg's default quality) as they arrive.
+    import imageio_ffmpeg
+
+    writer = None
+    count = 0
+    for img in imgs:
+        frame = as_rgb_frame(img)
+        if scale != 1.0:
+            size = (max(1, round(frame.width * scale)), max(1, round(frame.height * scale)))
+            frame = frame.resize(size, Image.BILINEAR)
+        if writer is None:
+            size = frame.size
+            writer = imageio_ffmpeg.write_frames(
+                mp4_file, size, fps=fps, codec="libx264", quality=None, macro_block_size=2
+            )
+            writer.send(None)
+        if frame.size != size:
+            frame = frame.resize(size, Image.BILINEAR)
+        writer.send(frame.tobytes())
+        count += 1
+    if writer is None:
+        raise Exception("No frames to write")
+    writer.close()
     print(f'Video saved to {mp4_file}.')
 
 def np_write_png(img_arr: np.ndarray, png_file):
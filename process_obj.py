@@ -1,57 +1,183 @@
 import os
 import numpy as np
 import argparse
-import trimesh
+from itertools import islice
+from asset_manifest import AssetManifest
+from mesh_cache import (
+    mesh_cache_path, is_mesh_cache_current, load_mesh_cache, update_mesh_cache_header, ensure_mesh_cache,
+    ObjRecords,
+)
 
 zup_tag = "ZUP"
+obj_tool_version = 2
+
+# rows formatted per write, bounds the text held in memory for multi-million vertex meshes
+obj_chunk_rows = 1 << 16
+
+def write_obj_block(file, line_format, arrays):
+    for start in range(0, arrays[0].shape[0], obj_chunk_rows):
+        chunk = [array[start: start + obj_chunk_rows] for array in arrays]
+        chunk = chunk[0] if len(chunk) == 1 else np.hstack(chunk)
+        file.write((line_format * chunk.shape[0]) % tuple(chunk.ravel().tolist()))
+
+def write_obj(
+    path: str,
+    vertices: np.ndarray,
+    faces: np.ndarray,
+    vertex_normals: np.ndarray = None,
+    uvs: np.ndarray = None,
+    vertex_colors: np.ndarray = None,
+    add_zup: bool = False,
+    digits: int = 8,
+):
+    # Same records as trimesh's OBJ export (v [r g b], vn, vt, f with 1-based v/vt/vn
+    # indices) but without materials or comments, written straight from the arrays.
+    value = f"%.{digits}f"
+    with open(path, "w", buffering=1 << 20) as file:
+        if add_zup:
+            file.write(f"# {zup_tag}\n")
+        if vertex_colors is not None and len(vertex_colors) > 0:
+            colors = np.asarray(vertex_colors)[:, :3]
+            if colors.dtype == np.uint8:
+                colors = colors / 255.0
+            write_obj_block(file, f"v {value} {value} {value} {value} {value} {value}\n", [vertices, colors])
+        else:
+            write_obj_block(file, f"v {value} {value} {value}\n", [vertices])
+        if vertex_normals is not None:
+            write_obj_block(file, f"vn {value} {value} {value}\n", [vertex_normals])
+        if uvs is not None:
+            write_obj_block(file, f"vt {value} {value}\n", [uvs])
+
+        if vertex_normals is not None and uvs is not None:
+            reference, repeat = "%d/%d/%d", 3
+        elif vertex_normals is not None:
+            reference, repeat = "%d//%d", 2
+        elif uvs is not None:
+            reference, repeat = "%d/%d", 2
+        else:
+            reference, repeat = "%d", 1
+        line_format = f"f {reference} {reference} {reference}\n"
+        for start in range(0, len(faces), obj_chunk_rows):
+            chunk = np.repeat(np.asarray(faces[start: start + obj_chunk_rows], dtype=np.int64) + 1, repeat, axis=1)
+            file.write((line_format * chunk.shape[0]) % tuple(chunk.ravel().tolist()))
 
 def export_without_mtl(mesh, path: str, add_zup: bool = False):
-    obj_str = trimesh.exchange.obj.export_obj(
-        mesh, include_color=True, include_texture=True, write_texture=False
+    uvs = getattr(mesh.visual, "uv", None)
+    if mesh.visual.kind in ["vertex", "face"]:
+        vertex_colors = mesh.visual.vertex_colors
+    else:
+        vertex_colors = None
+    # like trimesh's export, normals are only written when the mesh has them: loaded, assigned or
+    # already computed, never computed just for the export
+    normals = mesh.vertex_normals if "vertex_normals" in mesh._cache.cache else None
+    write_obj(
+        path,
+        vertices=mesh.vertices,
+        faces=mesh.faces,
+        vertex_normals=normals,
+        uvs=uvs if uvs is not None and len(np.shape(uvs)) == 2 else None,
+        vertex_colors=vertex_colors,
+        add_zup=add_zup,
     )
-    obj_list = obj_str.split("\n")
-    obj_list = [s for s in obj_list if not s.startswith("usemtl") and 
-                                       not s.startswith("mtllib") and 
-                                       not s.startswith("#")]
-    if add_zup:
-        obj_list = [f"# {zup_tag}"] + obj_list
-    obj_str = "\n".join(obj_list)
-    fw = open(path, "w")
-    fw.write(obj_str)
-    fw.close()
+
+# the tag is written on the first line, comments before it are tolerated within this many bytes
+zup_header_bytes = 4096
+
+def has_zup_tag(filename):
+    with open(filename, 'r', errors="replace") as file:
+        header = file.read(zup_header_bytes)
+    for line in header.splitlines():
+        if not line.startswith('#'):
+            break
+        if line.strip() == f"# {zup_tag}":
+            return True
+    return False
+
+def yup_to_zup(array):
+    # (x, y, z) -> (x, -z, y) in place, on the first three columns
+    y = array[:, 1].copy()
+    np.negative(array[:, 2], out=array[:, 1])
+    array[:, 2] = y
+    return array
+
+def convert_zup_lines(lines, prefix, value_format="%.8f"):
+    # rewrites the records starting with prefix ("v " or "vn ") in a chunk of lines
+    indices = [i for i, line in enumerate(lines) if line.startswith(prefix)]
+    if len(indices) == 0:
+        return
+    rows = [lines[i].split()[1:] for i in indices]
+    # vertex colors give some "v" records six values, convert each width separately
+    for width in set(len(row) for row in rows):
+        group = [k for k, row in enumerate(rows) if len(row) == width]
+        values = yup_to_zup(np.array([rows[k] for k in group], dtype=np.float64))
+        line_format = prefix + " ".join([value_format] * width) + "\n"
+        for k, value in zip(group, values.tolist()):
+            lines[indices[k]] = line_format % tuple(value)
 
 def fix_zup(filename):
-    with open(filename, 'r') as file:
-        for line in file:
-            if line.startswith('#'):
-                if line.strip() == f"# {zup_tag}":
-                    return
+    if has_zup_tag(filename):
+        # already converted, but OBJs that did not come from a GLB may still lack a sidecar
+        ensure_mesh_cache(filename)
+        return
 
     print(f"Convert {filename} to be z-up")
-    
-    mesh = trimesh.load_mesh(filename, skip_material=True)
-    vertices = mesh.vertices.copy()
-    vertices[:, 1], vertices[:, 2] = -mesh.vertices[:, 2], mesh.vertices[:, 1]
-    normals = mesh.vertex_normals.copy()
-    normals[:, 1], normals[:, 2] = -mesh.vertex_normals[:, 2], mesh.vertex_normals[:, 1]
-    mesh.vertices = vertices
-    mesh.vertex_normals = normals
-    export_without_mtl(mesh, filename, add_zup=True)
+
+    cache_file = mesh_cache_path(filename)
+    cache_current = is_mesh_cache_current(cache_file, filename)
+    # without a current sidecar, the converted records are collected to write one
+    records = None if cache_current else ObjRecords()
+    temp_file = f"{filename}.tmp"
+    try:
+        with open(filename, 'r') as src, open(temp_file, 'w', buffering=1 << 20) as dst:
+            dst.write(f"# {zup_tag}\n")
+            while True:
+                lines = list(islice(src, obj_chunk_rows))
+                if len(lines) == 0:
+                    break
+                convert_zup_lines(lines, "v ")
+                convert_zup_lines(lines, "vn ")
+                if records is not None:
+                    records.add_lines(lines)
+                dst.writelines(lines)
+        os.replace(temp_file, filename)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+    # the sidecar gets the same swap in place, a missing or stale one is built from the new OBJ
+    if cache_current:
+        mesh = load_mesh_cache(cache_file, mode="r+")
+        yup_to_zup(mesh.vertices)
+        if mesh.vertex_normals is not None:
+            yup_to_zup(mesh.vertex_normals)
+        mesh.vertices.flush()
+        del mesh
+        update_mesh_cache_header(cache_file, source=filename)
+    else:
+        ensure_mesh_cache(filename, records)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--check_all_models", action="store_true", default=False)
     parser.add_argument("--path", type=str, default=None)
+    parser.add_argument("--force", action="store_true", default=False)
     args = parser.parse_args()
 
     # test_file = "./assets/models/glb/eraser.glb"
     if args.check_all_models:
+        manifest = AssetManifest("obj", obj_tool_version)
+        if args.force:
+            manifest.entries.clear()
         walks = os.walk("./assets/models/")
         for dir_path, dirnames, filenames in walks:
             for filename in filenames:
                 if filename.endswith(".obj"):
                     file_path = os.path.join(dir_path, filename)
+                    if manifest.is_current(file_path):
+                        continue
                     fix_zup(file_path)
+                    manifest.record(file_path)
+        manifest.save()
     else:
         file_path = args.path
         fix_zup(file_path)
\ No newline at end of file
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+import os
+import sys
+import time
+import shlex
+import hashlib
+import argparse
+import numpy as np
+from PIL import Image
+
+# Stands in for luisa-render-pipe-render when testing build_luisa_animation.py without a GPU:
+#   python build_luisa_animation.py --renderer_path ./stand_in_renderer.py ...
+# It accepts the same command line and writes image_<mark>.png into the output folder after
+# sleeping STAND_IN_RENDER_SECONDS (default 0.5). The frame color is derived from the script
+# content, its size from STAND_IN_RENDER_SIZE (default 256).
+
+if __name__ == "__main__":
+    # build_luisa_animation.py passes "-b CUDA" and quoted paths as single arguments, the real
+    # renderer sees the same tokens once they are joined and split again
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", type=str, default="CUDA")
+    parser.add_argument("-o", type=str, required=True)
+    parser.add_argument("-m", type=str, required=True)
+    parser.add_argument("-r", action="store_true", default=False)
+    parser.add_argument("script", type=str)
+    args = parser.parse_args(shlex.split(" ".join(sys.argv[1:])))
+
+    with open(args.script, "rb") as file:
+        digest = hashlib.blake2b(file.read(), digest_size=3).digest()
+    time.sleep(float(os.environ.get("STAND_IN_RENDER_SECONDS", "0.5")))
+
+    size = int(os.environ.get("STAND_IN_RENDER_SIZE", "256"))
+    ramp = np.linspace(0.25, 1.0, size, dtype=np.float32)[None, :, None]
+    image = np.uint8(np.broadcast_to(np.frombuffer(digest, dtype=np.uint8) * ramp, (size, size, 3)))
+    os.makedirs(args.o, exist_ok=True)
+    Image.fromarray(image).save(os.path.join(args.o, f"image_{args.m}.png"))
+    print(f"Rendered {args.script} to {os.path.join(args.o, f'image_{args.m}.png')}")
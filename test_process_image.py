@@ -0,0 +1,26 @@
+import time
+from PIL import Image
+from process_image import load_frames
+
+def test_load_frames_yields_ready_frames_before_read_ahead_fills(tmp_path):
+    read_ahead = 8
+    png_files = list()
+    for i in range(2 * read_ahead):
+        png_file = str(tmp_path / f"{i:04d}.png")
+        Image.new("L", (4, 4), i).save(png_file)
+        png_files.append(png_file)
+
+    requested = list()
+
+    def slow_inputs():
+        # inputs arrive slower than a 4x4 PNG is read, frame 0 is done before input 1 is taken
+        for png_file in png_files:
+            requested.append(png_file)
+            yield png_file
+            time.sleep(0.05)
+
+    frames = load_frames(slow_inputs(), jobs=2, read_ahead=read_ahead)
+    first = next(frames)
+    assert first.getpixel((0, 0)) == 0
+    assert len(requested) < read_ahead
+    assert [frame.getpixel((0, 0)) for frame in frames] == list(range(1, 2 * read_ahead))
@@ -0,0 +1,207 @@
+import os
+import time
+import argparse
+import numpy as np
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from asset_manifest import AssetManifest
+
+# bump whenever the generated levels change for the same input
+pyramid_tool_version = 1
+pyramid_folder = ".pyramid"
+pyramid_levels = [2048, 1024, 512]
+pyramid_roots = ["./assets/textures/", "./assets/backgrounds/", "./assets/models/"]
+pyramid_extensions = (".png", ".jpg", ".jpeg", ".exr", ".hdr")
+
+def pyramid_path(file_path, level):
+    # ./a/b/wood_4k.jpg -> ./a/b/.pyramid/1024/wood_4k.jpg; hidden so asset_index does not list it
+    dir_name, filename = os.path.split(file_path)
+    return os.path.join(dir_name, pyramid_folder, str(level), filename)
+
+def closest_level(file_path, resolution):
+    # smallest cached level that is still at least `resolution` pixels on its longest side,
+    # the full-size file when there is none
+    if resolution is None:
+        return file_path
+    dir_name = os.path.join(os.path.dirname(file_path), pyramid_folder)
+    if not os.path.isdir(dir_name):
+        return file_path
+    levels = sorted(int(level) for level in os.listdir(dir_name) if level.isdigit())
+    for level in levels:
+        if level >= resolution:
+            level_path = pyramid_path(file_path, level)
+            if os.path.exists(level_path):
+                return level_path
+    return file_path
+
+def halve(image):
+    # 2x2 box filter in float32, odd edges are replicated; slices are cast one at a time so a
+    # uint8 source never exists as a full-size float copy
+    height, width = image.shape[:2]
+    if height % 2 == 1 or width % 2 == 1:
+        pad = [(0, height % 2), (0, width % 2)] + [(0, 0)] * (image.ndim - 2)
+        image = np.pad(image, pad, mode="edge")
+    result = image[0::2, 0::2].astype(np.float32)
+    result += image[1::2, 0::2]
+    result += image[0::2, 1::2]
+    result += image[1::2, 1::2]
+    result *= 0.25
+    return result
+
+def resize_area(image, level):
+    # area-weighted resample of a float32 image to `level` pixels on its longest side, per channel
+    # through PIL's "F" mode; only used for the last step of less than 2x
+    height, width = image.shape[:2]
+    scale = level / max(height, width)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    channels = image.reshape(height, width, -1)
+    resized = [
+        np.asarray(Image.fromarray(np.ascontiguousarray(channels[:, :, i])).resize(size, Image.BOX))
+        for i in range(channels.shape[2])
+    ]
+    return np.stack(resized, axis=2).reshape((size[1], size[0]) + image.shape[2:])
+
+def read_source(file_path):
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".exr":
+        import OpenEXR
+        from process_image import read_exr
+
+        exr_img = OpenEXR.InputFile(file_path)
+        header_channels = exr_img.header()['channels']
+        exr_img.close()
+        channels = sorted(header_channels)
+        pixel_types = {c: "HALF" if str(header_channels[c].type) == "HALF" else "FLOAT" for c in channels}
+        return read_exr(file_path, channels), {"channels": channels, "pixel_types": pixel_types}
+    if extension == ".hdr":
+        from process_image import read_image
+
+        return read_image(file_path), dict()
+    with Image.open(file_path) as image:
+        if image.mode == "P":
+            image = image.convert("RGBA")
+        elif image.mode == "1":
+            image = image.convert("L")
+        return np.asarray(image), dict()
+
+def write_level(level_path, image, dtype, info):
+    os.makedirs(os.path.dirname(level_path), exist_ok=True)
+    extension = os.path.splitext(level_path)[1].lower()
+    # written next to the target and renamed, so readers never see a partial level
+    temp_path = f"{os.path.splitext(level_path)[0]}.tmp{extension}"
+    if extension == ".exr":
+        import Imath
+        from process_image import write_exr
+
+        write_exr(temp_path, image, info["channels"], info["pixel_types"], Imath.Compression.PIZ_COMPRESSION)
+    elif extension == ".hdr":
+        import cv2
+
+        cv2.imwrite(temp_path, np.ascontiguousarray(image[:, :, ::-1], dtype=np.float32))
+    else:
+        if np.issubdtype(dtype, np.integer):
+            info_max = np.iinfo(dtype).max
+            image = np.clip(np.rint(image), 0, info_max).astype(dtype)
+        else:
+            image = image.astype(dtype)
+        options = {"quality": 95} if extension in (".jpg", ".jpeg") else dict()
+        Image.fromarray(image).save(temp_path, **options)
+    os.replace(temp_path, level_path)
+    return level_path
+
+def build_pyramid(file_path, levels=None):
+    # every level is reduced from the previous one: 2x box filter steps, then an area resample to
+    # exactly `level` pixels on the longest side; levels not smaller than the source are skipped.
+    # LDR levels keep the source dtype, EXR keeps the channel names and pixel types, HDR stays
+    # Radiance.
+    levels = pyramid_levels if levels is None else levels
+    image, info = read_source(file_path)
+    dtype = image.dtype
+    size = max(image.shape[:2])
+    outputs = list()
+    for level in sorted(levels, reverse=True):
+        if level >= size:
+            continue
+        while max(image.shape[:2]) >= 2 * level:
+            image = halve(image)
+        if max(image.shape[:2]) > level:
+            image = resize_area(image.astype(np.float32, copy=False), level)
+        outputs.append(write_level(pyramid_path(file_path, level), image, dtype, info))
+    print(f"Built {len(outputs)} levels of {file_path}")
+    return outputs
+
+def find_pyramid_sources(roots=None):
+    file_paths = list()
+    for root in pyramid_roots if roots is None else roots:
+        for dir_path, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            for filename in sorted(filenames):
+                if filename.lower().endswith(pyramid_extensions) and not filename.startswith("."):
+                    file_paths.append(os.path.join(dir_path, filename))
+    return file_paths
+
+def batch_build(file_paths, jobs=1, manifest=None, levels=None):
+    start = time.perf_counter()
+    if manifest is not None:
+        pending = [file_path for file_path in file_paths if not manifest.is_current(file_path)]
+    else:
+        pending = list(file_paths)
+    failures = list()
+    source_bytes, level_bytes = 0, 0
+
+    def on_done(file_path, outputs):
+        nonlocal source_bytes, level_bytes
+        source_bytes += os.path.getsize(file_path)
+        level_bytes += sum(os.path.getsize(output) for output in outputs)
+        if manifest is not None:
+            manifest.record(file_path, outputs)
+
+    if jobs <= 1:
+        for file_path in pending:
+            try:
+                on_done(file_path, build_pyramid(file_path, levels))
+            except Exception as e:
+                failures.append((file_path, repr(e)))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(build_pyramid, file_path, levels): file_path for file_path in pending}
+            for future in as_completed(futures):
+                try:
+                    on_done(futures[future], future.result())
+                except Exception as e:
+                    failures.append((futures[future], repr(e)))
+    if manifest is not None:
+        for file_path, error in failures:
+            manifest.forget(file_path)
+        manifest.save()
+    elapsed = time.perf_counter() - start
+
+    built = len(pending) - len(failures)
+    skipped = len(file_paths) - len(pending)
+    rate = len(pending) / elapsed if elapsed > 0 else 0.0
+    print(f"Built pyramids of {built}/{len(pending)} images ({skipped} unchanged) in {elapsed:.2f}s "
+          f"({rate:.2f} files/s, jobs={jobs}): {source_bytes / 1e6:.1f} MB -> {level_bytes / 1e6:.1f} MB of levels")
+    for file_path, error in sorted(failures):
+        print(f"    FAILED {file_path}: {error}")
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--check_all", action="store_true", default=False)
+    parser.add_argument("--path", type=str, default=None)
+    parser.add_argument("--levels", type=int, nargs="+", default=pyramid_levels)
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--force", action="store_true", default=False)
+    args = parser.parse_args()
+
+    if args.check_all:
+        levels = sorted(set(args.levels), reverse=True)
+        manifest = AssetManifest("pyramid", f"{pyramid_tool_version}-{'-'.join(map(str, levels))}")
+        if args.force:
+            manifest.entries.clear()
+        failures = batch_build(find_pyramid_sources(), jobs=args.jobs, manifest=manifest, levels=levels)
+        if len(failures) > 0:
+            raise SystemExit(1)
+    else:
+        build_pyramid(args.path, args.levels)
@@ -0,0 +1,218 @@
+import os
+import time
+import argparse
+import numpy as np
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# rows tonemapped per step, bounds the float32 scratch memory for 8k backgrounds
+tonemap_chunk_rows = 256
+hdr_extensions = (".exr", ".hdr")
+
+# Operators work in place on a float32 HxWx3 chunk that already has the exposure applied, with a
+# scratch buffer of the same shape; the result is clipped to [0, 1] and gamma encoded afterwards.
+def gamma_operator(x, scratch):
+    # exposure and gamma only
+    pass
+
+def reinhard_operator(x, scratch):
+    # x / (1 + x) per channel
+    np.add(x, 1.0, out=scratch)
+    x /= scratch
+
+# Narkowicz's fit of the ACES filmic curve, x (2.51 x + 0.03) / (x (2.43 x + 0.59) + 0.14), rewritten
+# as 2.51 / 2.43 + (k1 x - k2) / denominator so that the numerator can be formed in place
+aces_k1 = 0.03 - 2.51 * 0.59 / 2.43
+aces_k2 = 2.51 * 0.14 / 2.43
+
+def aces_operator(x, scratch):
+    np.multiply(x, 2.43, out=scratch)
+    scratch += 0.59
+    scratch *= x
+    scratch += 0.14
+    x *= aces_k1
+    x -= aces_k2
+    x /= scratch
+    x += 2.51 / 2.43
+
+tonemap_operators = {
+    "gamma": gamma_operator,
+    "reinhard": reinhard_operator,
+    "aces": aces_operator,
+}
+
+def exr_rgb_channels(names):
+    if all(c in names for c in "RGB"):
+        return ["R", "G", "B"]
+    # luminance-only or oddly named files are shown as gray
+    channel = "Y" if "Y" in names else sorted(names)[0]
+    return [channel] * 3
+
+def iter_rows(image_file, chunk_rows=tonemap_chunk_rows):
+    # float32 HxWx3 row blocks; EXR scanlines are read block by block, other formats are decoded
+    # once and sliced
+    if os.path.splitext(image_file)[1].lower() == ".exr":
+        import OpenEXR
+        import Imath
+
+        exr_img = OpenEXR.InputFile(image_file)
+        header = exr_img.header()
+        dw = header['dataWindow']
+        width = dw.max.x - dw.min.x + 1
+        channels = exr_rgb_channels(header['channels'].keys())
+        pt = Imath.PixelType(Imath.PixelType.FLOAT)
+        try:
+            for y0 in range(dw.min.y, dw.max.y + 1, chunk_rows):
+                y1 = min(y0 + chunk_rows, dw.max.y + 1) - 1
+                chunk = np.empty((y1 - y0 + 1, width, 3), dtype=np.float32)
+                for i, c in enumerate(channels):
+                    chunk[:, :, i] = np.frombuffer(exr_img.channel(c, pt, y0, y1), dtype=np.float32).reshape(-1, width)
+                yield chunk
+        finally:
+            exr_img.close()
+        return
+    from process_image import read_image
+
+    image = read_image(image_file)
+    if image.ndim == 2:
+        image = image[:, :, None]
+    if image.shape[2] < 3:
+        image = image[:, :, :1]
+    for y0 in range(0, image.shape[0], chunk_rows):
+        chunk = image[y0: y0 + chunk_rows]
+        yield np.array(np.broadcast_to(chunk[:, :, :3], chunk.shape[:2] + (3,)), dtype=np.float32)
+
+def image_range(image_file, chunk_rows=tonemap_chunk_rows):
+    low, high = np.inf, -np.inf
+    for chunk in iter_rows(image_file, chunk_rows):
+        low = min(low, float(chunk.min()))
+        high = max(high, float(chunk.max()))
+    return low, high
+
+def tonemap_image(image_file, operator="gamma", exposure=0.0, gamma=2.2, normalize=None,
+                  chunk_rows=tonemap_chunk_rows):
+    # uint8 HxWx3 of an HDR image. normalize is None, "max" (divide by the maximum) or "range"
+    # (map [min, max] to [0, 1]), applied before the exposure; both need one extra read.
+    apply = tonemap_operators[operator]
+    offset, scale = 0.0, 2.0 ** exposure
+    if normalize is not None:
+        low, high = image_range(image_file, chunk_rows)
+        if normalize == "range":
+            offset = low if high - low > 1e-12 else 0.0
+            high = high - offset
+        scale /= high if high > 1e-12 else 1.0
+    rows = list()
+    scratch = None
+    for chunk in iter_rows(image_file, chunk_rows):
+        if scratch is None or scratch.shape != chunk.shape:
+            scratch = np.empty_like(chunk)
+        if offset != 0.0:
+            chunk -= offset
+        if scale != 1.0:
+            chunk *= scale
+        apply(chunk, scratch)
+        np.clip(chunk, 0.0, 1.0, out=chunk)
+        if gamma != 1.0:
+            np.power(chunk, 1.0 / gamma, out=chunk)
+        chunk *= 255.0
+        rows.append(chunk.astype(np.uint8))
+    return np.concatenate(rows, axis=0)
+
+def ldr_filename(image_file, output_dir=None, root=None):
+    # next to the source, or in output_dir under the source's directory relative to root
+    filename = f"{os.path.splitext(os.path.basename(image_file))[0]}.png"
+    if output_dir is None:
+        return os.path.join(os.path.dirname(image_file), filename)
+    if root is not None:
+        output_dir = os.path.join(output_dir, os.path.relpath(os.path.dirname(image_file), root))
+    return os.path.normpath(os.path.join(output_dir, filename))
+
+def tonemap_file(image_file, png_file=None, operator="gamma", exposure=0.0, gamma=2.2, normalize=None,
+                 thumbnail=None):
+    png_file = ldr_filename(image_file) if png_file is None else png_file
+    image = Image.fromarray(tonemap_image(image_file, operator, exposure, gamma, normalize))
+    if thumbnail is not None:
+        image.thumbnail((thumbnail, thumbnail), Image.BOX)
+    image.save(png_file)
+    return png_file
+
+def find_hdr_files(root):
+    file_paths = list()
+    for dir_path, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in sorted(filenames):
+            if filename.lower().endswith(hdr_extensions) and not filename.startswith("."):
+                file_paths.append(os.path.join(dir_path, filename))
+    return file_paths
+
+def tonemap_directory(root, output_dir=None, jobs=1, operator="gamma", exposure=0.0, gamma=2.2,
+                      normalize=None, thumbnail=None):
+    start = time.perf_counter()
+    file_paths = find_hdr_files(root)
+    targets = dict()
+    for file_path in file_paths:
+        targets.setdefault(ldr_filename(file_path, output_dir, root), list()).append(file_path)
+    # sources sharing a target (x.exr and x.hdr) fail instead of overwriting each other
+    failures = list()
+    tasks = dict()
+    for png_file, sources in targets.items():
+        if len(sources) > 1:
+            for file_path in sources:
+                others = ", ".join(other for other in sources if other != file_path)
+                failures.append((file_path, f"{png_file} is also the output of {others}"))
+            continue
+        os.makedirs(os.path.dirname(png_file) or ".", exist_ok=True)
+        tasks[sources[0]] = (sources[0], png_file, operator, exposure, gamma, normalize, thumbnail)
+    if jobs <= 1:
+        for file_path, task in tasks.items():
+            try:
+                tonemap_file(*task)
+            except Exception as e:
+                failures.append((file_path, repr(e)))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(tonemap_file, *task): file_path for file_path, task in tasks.items()}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failures.append((futures[future], repr(e)))
+    elapsed = time.perf_counter() - start
+
+    source_bytes = sum(os.path.getsize(file_path) for file_path in file_paths)
+    rate = len(file_paths) / elapsed if elapsed > 0 else 0.0
+    print(f"Tonemapped {len(file_paths) - len(failures)}/{len(file_paths)} images ({source_bytes / 1e6:.1f} MB) "
+          f"in {elapsed:.2f}s ({rate:.2f} files/s, jobs={jobs})")
+    for file_path, error in sorted(failures):
+        print(f"    FAILED {file_path}: {error}")
+    return failures
+
+# directory runs write here unless --output_dir is given: PNGs next to the sources would be
+# picked up by asset_index and texture_pyramid as assets of their own
+default_output_dir = "./tonemapped"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", type=str, default="./assets/backgrounds/")
+    parser.add_argument("--output_dir", type=str, default=None)
+    parser.add_argument("--operator", type=str, default="aces", choices=list(tonemap_operators))
+    parser.add_argument("--exposure", type=float, default=0.0)
+    parser.add_argument("--gamma", type=float, default=2.2)
+    parser.add_argument("--normalize", type=str, default=None, choices=["max", "range"])
+    parser.add_argument("--thumbnail", type=int, default=None)
+    parser.add_argument("--jobs", type=int, default=1)
+    args = parser.parse_args()
+
+    if os.path.isdir(args.path):
+        failures = tonemap_directory(
+            args.path, default_output_dir if args.output_dir is None else args.output_dir, jobs=args.jobs, operator=args.operator, exposure=args.exposure,
+            gamma=args.gamma, normalize=args.normalize, thumbnail=args.thumbnail
+        )
+        if len(failures) > 0:
+            raise SystemExit(1)
+    else:
+        png_file = None if args.output_dir is None else ldr_filename(args.path, args.output_dir)
+        print(tonemap_file(
+            args.path, png_file, operator=args.operator, exposure=args.exposure,
+            gamma=args.gamma, normalize=args.normalize, thumbnail=args.thumbnail
+        ))